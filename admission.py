@@ -0,0 +1,149 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Rate limit exceeded')
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after=1):
+        super().__init__('Too many concurrent requests')
+        self.retry_after = retry_after
+
+
+def parse_rate(spec):
+    # "rate:burst" -> (requests per second, bucket size); a bare rate allows
+    # bursts of one second's worth.
+    rate, _, burst = spec.partition(':')
+    rate = float(rate)
+    return rate, float(burst) if burst else max(rate, 1.0)
+
+
+def parse_rate_limits(spec):
+    # "endpoint=rate:burst,..." -> {endpoint: (rate, burst)}
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        endpoint, _, rate = item.partition('=')
+        limits[endpoint.strip()] = parse_rate(rate)
+    return limits
+
+
+def client_address(req, proxy_hops=0):
+    # Behind `proxy_hops` trusted proxies the client is the address the
+    # outermost one saw, as with werkzeug's ProxyFix(x_for=proxy_hops).
+    if proxy_hops:
+        route = req.access_route
+        if len(route) >= proxy_hops:
+            return route[-proxy_hops]
+    return req.remote_addr or 'unknown'
+
+
+class AdmissionControl:
+    # Sheds load before it reaches the database. Every (client, endpoint)
+    # pair has a token bucket refilled at the endpoint's rate from
+    # `rate_limits` (or `default_rate`; None means unlimited); a request that
+    # finds its bucket empty is rejected with RateLimited. Buckets are per
+    # process, so the effective limit is multiplied by the worker count.
+    # Views wrapped in limited() additionally share `max_concurrency` slots
+    # per process and raise Overloaded when none frees up within
+    # `queue_timeout` seconds.
+    # Buckets of the least recently seen clients are dropped beyond
+    # `max_clients`, which can only make them fuller. `on_shed(endpoint,
+    # reason)` is an optional instrumentation hook.
+    def __init__(self, rate_limits=None, default_rate=None, max_clients=10000,
+                 max_concurrency=0, queue_timeout=0.0, on_shed=None):
+        self.rate_limits = rate_limits or {}
+        self.default_rate = default_rate
+        self.max_clients = max_clients
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.on_shed = on_shed
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+        self._admitted = 0
+        self._in_flight = 0
+        self._rate_limited = {}
+        self._overloaded = {}
+
+    def shed(self, endpoint, reason):
+        # Counts a request rejected for `reason` ('rate_limited' or
+        # 'overloaded').
+        counts = self._rate_limited if reason == 'rate_limited' else self._overloaded
+        with self._lock:
+            counts[endpoint] = counts.get(endpoint, 0) + 1
+        if self.on_shed is not None:
+            self.on_shed(endpoint, reason)
+
+    def check_rate(self, client, endpoint):
+        limit = self.rate_limits.get(endpoint, self.default_rate)
+        if limit is None:
+            return
+        rate, burst = limit
+        key = (client, endpoint)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            self.shed(endpoint, 'rate_limited')
+            raise RateLimited(math.ceil((1 - tokens) / rate) if rate > 0 else 60)
+
+    def enter(self, endpoint):
+        if self._slots is not None and not self._slots.acquire(timeout=self.queue_timeout):
+            self.shed(endpoint, 'overloaded')
+            raise Overloaded()
+        with self._lock:
+            self._admitted += 1
+            self._in_flight += 1
+
+    def leave(self):
+        with self._lock:
+            self._in_flight -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def limited(self, view):
+        # A slot is held until the response is sent, so streamed responses
+        # keep theirs while they still read rows.
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            self.enter(request.endpoint)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                self.leave()
+                raise
+            if response.is_streamed:
+                response.call_on_close(self.leave)
+            else:
+                self.leave()
+            return response
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self._in_flight,
+                'admitted': self._admitted,
+                'clients': len(self._buckets),
+                'rate_limited': dict(self._rate_limited),
+                'overloaded': dict(self._overloaded),
+                'shed': sum(self._rate_limited.values()) + sum(self._overloaded.values()),
+            }
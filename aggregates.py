@@ -0,0 +1,122 @@
+from contextlib import closing
+
+
+# user_object_totals (read by /data/points, /data/time and /data/dashboard)
+# and the 'objects' data version are maintained by triggers on `objects`
+# (schema migration 5), in the same transaction as whichever tool writes it.
+# rebuild_user_totals() remains as a consistency check and repair.
+
+
+def rebuild_user_totals(conn, log=print):
+    # Recomputes the totals from `objects`, reports every user whose stored
+    # row had drifted, and replaces the table contents in one transaction.
+    # `objects` is read FOR SHARE so no write (and trigger update of the
+    # totals) can land between the read and the replacement.
+    with closing(conn.cursor(dictionary=True)) as cursor:
+        cursor.execute("""
+            SELECT user_initials, SUM(score) AS total_score, SUM(tries) AS total_tries, COUNT(*) AS object_count
+            FROM objects
+            WHERE user_initials IS NOT NULL
+            GROUP BY user_initials
+            FOR SHARE
+        """)
+        expected = {row['user_initials']: row for row in cursor.fetchall()}
+
+        cursor.execute("SELECT user_initials, total_score, total_tries, object_count FROM user_object_totals FOR UPDATE")
+        stored = {row['user_initials']: row for row in cursor.fetchall()}
+
+        drift = []
+        for initials in sorted(set(expected) | set(stored)):
+            want = expected.get(initials)
+            have = stored.get(initials)
+            if want is None or have is None \
+                    or int(want['object_count']) != have['object_count'] \
+                    or int(want['total_tries']) != have['total_tries'] \
+                    or abs(float(want['total_score']) - have['total_score']) > 1e-6:
+                drift.append(initials)
+                log("Drift for %s: stored=%s expected=%s" % (initials, have, want))
+
+        cursor.execute("DELETE FROM user_object_totals")
+        cursor.executemany("""
+            INSERT INTO user_object_totals (user_initials, total_score, total_tries, object_count)
+            VALUES (%s, %s, %s, %s)
+        """, [
+            (initials, float(row['total_score']), int(row['total_tries']), int(row['object_count']))
+            for initials, row in expected.items()
+        ])
+        conn.commit()
+        return drift
+
+
+# A score event is one applied user_levels write. statistics keeps a running
+# count, mean and max per user and leaderboard keeps the max, so each event is
+# O(1) instead of a scan. Rows are processed in order by MySQL, so several
+# events for the same user in one statement accumulate correctly. Note that
+# ON DUPLICATE KEY UPDATE assigns left to right: average_score must be
+# computed before games_played is incremented.
+def record_score_events(cursor, updates):
+    if not updates:
+        return
+    params = []
+    for update in updates:
+        params.extend((update['user_initials'], update['score'], update['score']))
+    cursor.execute("""
+        INSERT INTO statistics (initials, games_played, average_score, highest_score)
+        VALUES %s
+        ON DUPLICATE KEY UPDATE
+            average_score = (average_score * games_played + VALUES(average_score)) / (games_played + 1),
+            highest_score = GREATEST(highest_score, VALUES(highest_score)),
+            games_played = games_played + 1
+    """ % ','.join(['(%s, 1, %s, %s)'] * len(updates)), tuple(params))
+
+    best = {}
+    for update in updates:
+        best[update['user_initials']] = max(update['score'], best.get(update['user_initials'], update['score']))
+    params = []
+    for initials, score in best.items():
+        params.extend((initials, score))
+    cursor.execute("""
+        INSERT INTO leaderboard (student_id, highest_score)
+        VALUES %s
+        ON DUPLICATE KEY UPDATE
+            highest_score = GREATEST(highest_score, VALUES(highest_score))
+    """ % ','.join(['(%s, %s)'] * len(best)), tuple(params))
+
+
+def rebuild_statistics(conn, log=print):
+    # Backfill for data written before scores were tracked incrementally. Only
+    # the latest result per level survives in user_levels, so games_played is
+    # recomputed as the number of levels a user has played. Rows that
+    # record_score_events() has already counted (games_played > 0) hold more
+    # history than user_levels and are left alone, and highest scores only
+    # ever go up, so running it again is harmless.
+    with closing(conn.cursor()) as cursor:
+        cursor.execute("""
+            INSERT IGNORE INTO statistics (initials, games_played, average_score, highest_score)
+            SELECT initials, 0, 0, 0 FROM users
+        """)
+        cursor.execute("""
+            INSERT IGNORE INTO leaderboard (student_id, highest_score)
+            SELECT initials, 0 FROM users
+        """)
+        cursor.execute("""
+            UPDATE statistics s
+            LEFT JOIN (
+                SELECT user_initials, COUNT(*) AS played, AVG(score) AS average, MAX(score) AS highest
+                FROM user_levels
+                WHERE tries > 0 OR completed
+                GROUP BY user_initials
+            ) ul ON ul.user_initials = s.initials
+            SET s.games_played = COALESCE(ul.played, 0),
+                s.average_score = COALESCE(ul.average, 0),
+                s.highest_score = GREATEST(s.highest_score, COALESCE(ul.highest, 0))
+            WHERE s.games_played = 0
+        """)
+        log("Backfilled statistics for %d users" % cursor.rowcount)
+        cursor.execute("""
+            UPDATE leaderboard l
+            JOIN statistics s ON s.initials = l.student_id
+            SET l.highest_score = GREATEST(l.highest_score, s.highest_score)
+        """)
+        log("Backfilled leaderboard for %d users" % cursor.rowcount)
+        conn.commit()
@@ -1,120 +1,382 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-import mysql.connector
-from flasgger import Swagger, swag_from
+from mysql.connector import errors as mysql_errors
+from mysql.connector.constants import ClientFlag
+import csv
+import io
+import os
 
-def create_app():
+from db import ConnectionPool, PoolTimeout
+from routing import ReadRouter, READ_YOUR_WRITES_HEADER
+import metrics
+import profiling
+import docs
+from docs import swag_from
+import encoding
+from schema import migrate
+from aggregates import rebuild_user_totals, rebuild_statistics, record_score_events
+from leaderboard import Leaderboard
+from progress import normalize_level_update, collapse_level_updates, existing_keys, apply_level_updates
+from writebehind import WriteBehindBuffer, BufferFull
+from cache import ResponseCache
+from singleflight import SingleFlight
+from admission import AdmissionControl, RateLimited, Overloaded, client_address, parse_rate, parse_rate_limits
+from versions import DataVersions
+from streaming import stream_group_scores
+from summary import group_score_summary
+from queries import (POINTS_COLUMN, TIME_COLUMN, GROUPS_QUERY, FACETS_QUERY, LOGIN_QUERY, REHASH_PASSWORD,
+                     LEADERBOARD_QUERY, UPDATE_USER_LEVEL, USER_EXISTS, user_totals_query, lists_query, dashboard_facets,
+                     group_comparison_where, group_scores_query, group_scores)
+from passwords import PasswordHasher, HasherBusy
+
+def create_app(config=None):
     app = Flask(__name__)
-    CORS(app, origins=['http://localhost:3000'])
-    swagger = Swagger(app)
+    CORS(app, origins=['http://localhost:3000'], expose_headers=[READ_YOUR_WRITES_HEADER])
+
+    # Connection pool sizing is per process, so with gunicorn the total number
+    # of MySQL connections is workers * (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW).
+    app.config.update(
+        DB_HOST=os.environ.get('DB_HOST', 'database-1.cpm0ooec0kjr.us-east-1.rds.amazonaws.com'),
+        DB_PORT=int(os.environ.get('DB_PORT', 3306)),
+        DB_USER=os.environ.get('DB_USER', 'admin'),
+        DB_PASSWORD=os.environ.get('DB_PASSWORD', 'Elcuentodeapieron2024'),
+        DB_NAME=os.environ.get('DB_NAME', 'gamedb'),
+        DB_POOL_SIZE=int(os.environ.get('DB_POOL_SIZE', 5)),
+        DB_POOL_MAX_OVERFLOW=int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+        DB_POOL_TIMEOUT=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        DB_POOL_RECYCLE=int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+        DB_PREPARED_CACHE_SIZE=int(os.environ.get('DB_PREPARED_CACHE_SIZE', 16)),
+        DB_REPLICA_HOST=os.environ.get('DB_REPLICA_HOST'),
+        DB_REPLICA_PORT=int(os.environ.get('DB_REPLICA_PORT', 0)) or None,
+        DB_REPLICA_USER=os.environ.get('DB_REPLICA_USER'),
+        DB_REPLICA_PASSWORD=os.environ.get('DB_REPLICA_PASSWORD'),
+        DB_REPLICA_MAX_LAG=float(os.environ.get('DB_REPLICA_MAX_LAG', 5)),
+        DB_REPLICA_CHECK_INTERVAL=float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5)),
+        # Set to 0 for replicas that do not expose SHOW REPLICA STATUS.
+        DB_REPLICA_LAG_CHECK=os.environ.get('DB_REPLICA_LAG_CHECK', '1') == '1',
+        READ_YOUR_WRITES_SECONDS=float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5)),
+        # Only used by the ASGI app (asgi.py), whose coroutines share one pool.
+        ASYNC_DB_POOL_MIN=int(os.environ.get('ASYNC_DB_POOL_MIN', 5)),
+        ASYNC_DB_POOL_MAX=int(os.environ.get('ASYNC_DB_POOL_MAX', 20)),
+        LEADERBOARD_REFRESH_SECONDS=float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 30)),
+        USER_LEVELS_BATCH_MAX=int(os.environ.get('USER_LEVELS_BATCH_MAX', 1000)),
+        USER_LEVELS_WRITE_BEHIND=os.environ.get('USER_LEVELS_WRITE_BEHIND', '0') == '1',
+        WRITE_BEHIND_MAX_PENDING=int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 5000)),
+        WRITE_BEHIND_FLUSH_SIZE=int(os.environ.get('WRITE_BEHIND_FLUSH_SIZE', 200)),
+        WRITE_BEHIND_FLUSH_INTERVAL=float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', 1.0)),
+        WRITE_BEHIND_PUT_TIMEOUT=float(os.environ.get('WRITE_BEHIND_PUT_TIMEOUT', 2.0)),
+        WRITE_BEHIND_MAX_RETRIES=int(os.environ.get('WRITE_BEHIND_MAX_RETRIES', 5)),
+        WRITE_BEHIND_MAX_BACKOFF=float(os.environ.get('WRITE_BEHIND_MAX_BACKOFF', 30.0)),
+        RESPONSE_CACHE_ENABLED=os.environ.get('RESPONSE_CACHE_ENABLED', '1') == '1',
+        RESPONSE_CACHE_TTL=float(os.environ.get('RESPONSE_CACHE_TTL', 30)),
+        RESPONSE_CACHE_MAX_ENTRIES=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 512)),
+        DATA_VERSION_MAX_AGE=float(os.environ.get('DATA_VERSION_MAX_AGE', 1.0)),
+        SINGLE_FLIGHT_ENABLED=os.environ.get('SINGLE_FLIGHT_ENABLED', '1') == '1',
+        SINGLE_FLIGHT_TIMEOUT=float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 30)),
+        # Per-client token buckets as "rate:burst" (requests per second, bucket
+        # size), by endpoint in RATE_LIMITS ("endpoint=rate:burst,...") and
+        # RATE_LIMIT_DEFAULT for the others (empty for no limit). Buckets live
+        # in each worker process, so a client can make up to workers * rate
+        # requests per second. Off by default: behind a load balancer or nginx
+        # every client has the proxy's address unless RATE_LIMIT_PROXY_HOPS is
+        # set to the number of trusted proxies.
+        RATE_LIMIT_ENABLED=os.environ.get('RATE_LIMIT_ENABLED', '0') == '1',
+        RATE_LIMIT_DEFAULT=os.environ.get('RATE_LIMIT_DEFAULT', '20:40'),
+        RATE_LIMITS=os.environ.get('RATE_LIMITS', 'update_user_level=10:30,get_group_comparison_data=2:10'),
+        RATE_LIMIT_MAX_CLIENTS=int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 10000)),
+        RATE_LIMIT_PROXY_HOPS=int(os.environ.get('RATE_LIMIT_PROXY_HOPS', 0)),
+        # Concurrent /data/* queries per process (0 for no limit) and how long
+        # a request waits for a slot before getting a 503.
+        DATA_MAX_CONCURRENCY=int(os.environ.get('DATA_MAX_CONCURRENCY', 8)),
+        DATA_QUEUE_TIMEOUT=float(os.environ.get('DATA_QUEUE_TIMEOUT', 0.5)),
+        GROUP_COMPARISON_DEFAULT_GROUPS=('A', 'B', 'C', 'D'),
+        GROUP_COMPARISON_STREAM_CHUNK=int(os.environ.get('GROUP_COMPARISON_STREAM_CHUNK', 1000)),
+        PASSWORD_HASH_WORKERS=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+        PASSWORD_HASH_MAX_IN_FLIGHT=int(os.environ.get('PASSWORD_HASH_MAX_IN_FLIGHT', 8)),
+        PASSWORD_HASH_BULK_IN_FLIGHT=int(os.environ.get('PASSWORD_HASH_BULK_IN_FLIGHT', 0)) or None,
+        PASSWORD_HASH_QUEUE_TIMEOUT=float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5.0)),
+        PASSWORD_HASH_METHOD=os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000'),
+        PASSWORD_HASH_SALT_LENGTH=int(os.environ.get('PASSWORD_HASH_SALT_LENGTH', 16)),
+        ROSTER_IMPORT_MAX=int(os.environ.get('ROSTER_IMPORT_MAX', 200)),
+        METRICS_ENABLED=os.environ.get('METRICS_ENABLED', '1') == '1',
+        JSON_ENCODER=os.environ.get('JSON_ENCODER', 'auto'),
+        COMPRESS_ENABLED=os.environ.get('COMPRESS_ENABLED', '1') == '1',
+        COMPRESS_MIN_SIZE=int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+        COMPRESS_GZIP_LEVEL=int(os.environ.get('COMPRESS_GZIP_LEVEL', 5)),
+        COMPRESS_BROTLI_QUALITY=int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4)),
+        PROFILE_DIR=os.environ.get('PROFILE_DIR', 'profiles'),
+        PROFILE_TOKEN=os.environ.get('PROFILE_TOKEN'),
+        PROFILE_SAMPLE_RATE=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        PROFILE_MAX_FILES=int(os.environ.get('PROFILE_MAX_FILES', 50)),
+        # 'lazy' builds the Flasgger docs on the first /apidocs or /apispec
+        # request; 'off' (for production workers) serves no docs at all.
+        API_DOCS=os.environ.get('API_DOCS', 'lazy'),
+        API_DOCS_SPEC_FILE=os.environ.get('API_DOCS_SPEC_FILE'),
+        SCHEMA_MIGRATE_ON_START=os.environ.get('SCHEMA_MIGRATE_ON_START', '1') == '1',
+    )
+    if config:
+        app.config.update(config)
+
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app)
+
+    if app.config['COMPRESS_ENABLED']:
+        encoding.init_app(app)
+
+    # /data/* payloads can list thousands of rows, so they are encoded with
+    # the fastest available JSON backend instead of jsonify.
+    json_codec = encoding.JSONCodec(
+        backend=app.config['JSON_ENCODER'],
+        sort_keys=app.config['JSON_SORT_KEYS'],
+        on_encode=metrics.observe_json if app.config['METRICS_ENABLED'] else None,
+    )
+    app.extensions['json_codec'] = json_codec
 
-    # Database configuration
+    def json_response(data, status=200):
+        return app.response_class(json_codec.dumps(data), status=status, mimetype='application/json')
+
+    # Profiling is only wired in when it can trigger (a token or a sample rate).
+    if app.config['PROFILE_TOKEN'] or app.config['PROFILE_SAMPLE_RATE'] > 0:
+        profiling.init_app(app)
+
+    # Database configuration. FOUND_ROWS makes UPDATE report matched rather
+    # than changed rows, so a replayed score write still counts as applied.
     db_config = {
-        'host': 'database-1.cpm0ooec0kjr.us-east-1.rds.amazonaws.com',
-        'user': 'admin',
-        'password': 'Elcuentodeapieron2024',
-        'database': 'gamedb'
+        'host': app.config['DB_HOST'],
+        'port': app.config['DB_PORT'],
+        'user': app.config['DB_USER'],
+        'password': app.config['DB_PASSWORD'],
+        'database': app.config['DB_NAME'],
+        'client_flags': [ClientFlag.FOUND_ROWS],
     }
 
-    def get_db_connection():
-        return mysql.connector.connect(**db_config)
+    pool = ConnectionPool(
+        db_config,
+        size=app.config['DB_POOL_SIZE'],
+        max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        recycle=app.config['DB_POOL_RECYCLE'],
+        on_acquire=metrics.observe_acquire if app.config['METRICS_ENABLED'] else None,
+        on_query=metrics.observe_query if app.config['METRICS_ENABLED'] else None,
+        prepared_cache_size=app.config['DB_PREPARED_CACHE_SIZE'],
+    )
+    app.extensions['db_pool'] = pool
+
+    # Optional read replica for the /data/* dashboards. Unset DB_REPLICA_*
+    # values default to the primary's; without DB_REPLICA_HOST all reads
+    # stay on the primary.
+    replica = None
+    if app.config['DB_REPLICA_HOST']:
+        replica = ConnectionPool(
+            dict(
+                db_config,
+                host=app.config['DB_REPLICA_HOST'],
+                port=app.config['DB_REPLICA_PORT'] or db_config['port'],
+                user=app.config['DB_REPLICA_USER'] or db_config['user'],
+                password=app.config['DB_REPLICA_PASSWORD'] or db_config['password'],
+            ),
+            size=app.config['DB_POOL_SIZE'],
+            max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+            timeout=app.config['DB_POOL_TIMEOUT'],
+            recycle=app.config['DB_POOL_RECYCLE'],
+            on_acquire=metrics.observe_acquire if app.config['METRICS_ENABLED'] else None,
+            on_query=metrics.observe_query if app.config['METRICS_ENABLED'] else None,
+        )
+        app.extensions['db_replica_pool'] = replica
+
+    reads = ReadRouter(
+        pool, replica,
+        max_lag=app.config['DB_REPLICA_MAX_LAG'],
+        check_interval=app.config['DB_REPLICA_CHECK_INTERVAL'],
+        read_your_writes=app.config['READ_YOUR_WRITES_SECONDS'],
+        lag_check=app.config['DB_REPLICA_LAG_CHECK'],
+    )
+    app.extensions['db_reads'] = reads
+
+    # Clients that just wrote read from the primary for a few seconds so they
+    # see their own registration or score even if the replica lags behind.
+    # Cross-origin clients echo the X-Primary-Until response header instead
+    # of relying on the cookie.
+    WRITE_ENDPOINTS = ('register', 'register_bulk', 'update_user_level', 'update_user_levels_batch')
+
+    @app.after_request
+    def pin_writer_to_primary(response):
+        if request.endpoint in WRITE_ENDPOINTS and request.method != 'OPTIONS' and response.status_code < 400:
+            reads.mark_write(response)
+        return response
+
+    @app.errorhandler(PoolTimeout)
+    def handle_pool_timeout(e):
+        return make_response(jsonify({'success': False, 'message': 'Server busy, try again.'}), 503)
+
+    hasher = PasswordHasher(
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_in_flight=app.config['PASSWORD_HASH_MAX_IN_FLIGHT'],
+        bulk_in_flight=app.config['PASSWORD_HASH_BULK_IN_FLIGHT'],
+        queue_timeout=app.config['PASSWORD_HASH_QUEUE_TIMEOUT'],
+        method=app.config['PASSWORD_HASH_METHOD'],
+        salt_length=app.config['PASSWORD_HASH_SALT_LENGTH'],
+    )
+    app.extensions['password_hasher'] = hasher
+
+    @app.errorhandler(HasherBusy)
+    def handle_hasher_busy(e):
+        response = make_response(jsonify({'success': False, 'message': 'Server busy, try again.'}), 503)
+        response.headers['Retry-After'] = '1'
+        return response
+
+    # Misbehaving clients and overload are turned away before a connection is
+    # checked out: rate limits apply to every route except stats and metrics,
+    # the concurrency limit to the /data/* routes that query the database.
+    admission = AdmissionControl(
+        rate_limits=parse_rate_limits(app.config['RATE_LIMITS']) if app.config['RATE_LIMIT_ENABLED'] else None,
+        default_rate=(parse_rate(app.config['RATE_LIMIT_DEFAULT'])
+                      if app.config['RATE_LIMIT_ENABLED'] and app.config['RATE_LIMIT_DEFAULT'] else None),
+        max_clients=app.config['RATE_LIMIT_MAX_CLIENTS'],
+        max_concurrency=app.config['DATA_MAX_CONCURRENCY'],
+        queue_timeout=app.config['DATA_QUEUE_TIMEOUT'],
+        on_shed=metrics.observe_shed if app.config['METRICS_ENABLED'] else None,
+    )
+    app.extensions['admission'] = admission
 
-    # Create tables if they don't exist before any request
     @app.before_request
-    def create_tables():
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Ensure users table is created
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                initials VARCHAR(255) PRIMARY KEY,
-                password VARCHAR(255) NOT NULL,
-                role VARCHAR(50) NOT NULL,
-                list VARCHAR(50),
-                `group` VARCHAR(50),
-                gender VARCHAR(50)
-            );
-        """)
-
-        # Ensure statistics table is created
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS statistics (
-                initials VARCHAR(255),
-                games_played INT DEFAULT 0,
-                average_score FLOAT DEFAULT 0,
-                highest_score FLOAT DEFAULT 0,
-                PRIMARY KEY (initials),
-                FOREIGN KEY (initials) REFERENCES users(initials)
-            );
-        """)
-
-        # Ensure leaderboard table is created
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS leaderboard (
-                student_id VARCHAR(255),
-                highest_score FLOAT DEFAULT 0,
-                PRIMARY KEY (student_id),
-                FOREIGN KEY (student_id) REFERENCES users(initials)
-            );
-        """)
-
-        # Ensure objects table is created
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS objects (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                score FLOAT NOT NULL,
-                tries INT NOT NULL,
-                user_initials VARCHAR(255),
-                FOREIGN KEY (user_initials) REFERENCES users(initials)
-            );
-        """)
-
-        # Ensure levels table is created
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS levels (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                max_score INT NOT NULL
-            );
-        """)
-
-        # Ensure user_levels table is created
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_levels (
-                user_initials VARCHAR(255),
-                level_id INT,
-                completed BOOLEAN DEFAULT FALSE,
-                score INT DEFAULT 0,
-                tries INT DEFAULT 0,
-                PRIMARY KEY (user_initials, level_id),
-                FOREIGN KEY (user_initials) REFERENCES users(initials),
-                FOREIGN KEY (level_id) REFERENCES levels(id)
-            );
-        """)
-
-        # Create default levels if not exists
-        cursor.execute("SELECT * FROM levels")
-        cursor.fetchall()  # Consume all results to avoid "Unread result found"
-        if cursor.rowcount == 0:
-            default_levels = [
-                ('Level 1', 100),
-                ('Level 2', 200),
-                ('Level 3', 300)
-            ]
-            cursor.executemany("INSERT INTO levels (name, max_score) VALUES (%s, %s)", default_levels)
+    def check_rate_limit():
+        if request.method == 'OPTIONS' or request.endpoint is None or request.path.startswith(('/stats/', '/metrics')):
+            return
+        admission.check_rate(client_address(request, app.config['RATE_LIMIT_PROXY_HOPS']), request.endpoint)
+
+    @app.errorhandler(RateLimited)
+    def handle_rate_limited(e):
+        response = make_response(jsonify({'success': False, 'message': 'Too many requests, slow down.'}), 429)
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+    @app.errorhandler(Overloaded)
+    def handle_overloaded(e):
+        response = make_response(jsonify({'success': False, 'message': 'Server busy, try again.'}), 503)
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+    # Schema migrations run once per process start (or once per deployment
+    # via `flask migrate-db` with SCHEMA_MIGRATE_ON_START=0), never per request.
+    def run_migrations(deploy=False):
+        with pool.connection() as conn:
+            return migrate(conn, deploy=deploy)
+
+    @app.cli.command('migrate-db')
+    def migrate_db_command():
+        applied = run_migrations(deploy=True)
+        print("Schema is up to date (applied: %s)" % (applied or 'none'))
+
+    @app.cli.command('rebuild-aggregates')
+    def rebuild_aggregates_command():
+        with pool.connection() as conn:
+            drift = rebuild_user_totals(conn)
+            data_versions.bump(conn, 'objects')
+        print("Rebuilt user_object_totals (%d users had drifted)" % len(drift))
+
+    @app.cli.command('rebuild-statistics')
+    def rebuild_statistics_command():
+        with pool.connection() as conn:
+            rebuild_statistics(conn)
+            data_versions.bump(conn, 'scores')
+
+    if app.config['SCHEMA_MIGRATE_ON_START']:
+        # A failed migration must not take every worker down; the app keeps
+        # serving on the schema it has and `flask migrate-db` reports why.
+        try:
+            run_migrations()
+        except Exception as e:
+            print("Schema migration at start-up failed, serving with the current schema "
+                  "(run `flask migrate-db`):", str(e))
+
+    def load_leaderboard():
+        with reads.cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(LEADERBOARD_QUERY)
+            return cursor.fetchall()
+
+    # Dashboard responses are tagged with what they read: 'users' (register),
+    # 'scores' (user_levels writes) and 'objects' (bumped by the triggers on
+    # `objects`, schema migration 5, since other tools write it). The shared
+    # version counters drive both the ETags and the validity of per-worker
+    # cache entries.
+    # Requests pinned to the primary skip both, since the counters and cached
+    # bodies may come from a lagging replica.
+    data_versions = DataVersions(reads, max_age=app.config['DATA_VERSION_MAX_AGE'],
+                                 bypass=reads.pinned_to_primary)
+    app.extensions['data_versions'] = data_versions
+
+    # The in-process leaderboard is reloaded on a timer; its ETag names the
+    # counters it was loaded at plus this worker's writes applied since, so a
+    # 304 never pins a body older than the ETag and moving counters do not
+    # force a reload of the whole table.
+    leaderboard = Leaderboard(load_leaderboard, refresh_interval=app.config['LEADERBOARD_REFRESH_SECONDS'],
+                              version=lambda: data_versions.etag(('users', 'scores')))
+    app.extensions['leaderboard'] = leaderboard
+
+    response_cache = ResponseCache(
+        max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+        ttl=app.config['RESPONSE_CACHE_TTL'],
+        enabled=app.config['RESPONSE_CACHE_ENABLED'],
+        version_fn=data_versions.etag,
+        bypass=reads.pinned_to_primary,
+    )
+    app.extensions['response_cache'] = response_cache
+
+    # Identical dashboard requests that miss the cache at the same time share
+    # one query instead of each taking a connection.
+    single_flight = SingleFlight(
+        enabled=app.config['SINGLE_FLIGHT_ENABLED'],
+        timeout=app.config['SINGLE_FLIGHT_TIMEOUT'],
+        bypass=reads.pinned_to_primary,
+    )
+    app.extensions['single_flight'] = single_flight
+
+    def write_level_updates(updates):
+        # Applies already-collapsed level updates in one transaction and
+        # returns the (user_initials, level_id) keys that exist and were written.
+        with pool.cursor() as (conn, cursor):
+            found = existing_keys(cursor, [(u['user_initials'], u['level_id']) for u in updates])
+            applied = [u for u in updates if (u['user_initials'], u['level_id']) in found]
+            apply_level_updates(cursor, applied)
+            record_score_events(cursor, applied)
             conn.commit()
+            if applied:
+                data_versions.bump(conn, 'scores')
+        for update in applied:
+            leaderboard.update_score(update['user_initials'], update['score'])
+        if applied:
+            response_cache.invalidate('scores')
+        return found
+
+    def is_transient_error(error):
+        # Lost connections, lock wait timeouts (1205) and deadlocks (1213)
+        # fail every row alike, so the batch is retried without bisecting it.
+        if isinstance(error, (PoolTimeout, mysql_errors.InterfaceError, mysql_errors.OperationalError)):
+            return True
+        return getattr(error, 'errno', None) in (1205, 1213)
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+    # Optional write-behind mode for PUT /user_levels/<user_initials>: updates
+    # are acknowledged once buffered and committed by a background flusher.
+    write_behind = None
+    if app.config['USER_LEVELS_WRITE_BEHIND']:
+        write_behind = WriteBehindBuffer(
+            write_level_updates,
+            max_pending=app.config['WRITE_BEHIND_MAX_PENDING'],
+            flush_size=app.config['WRITE_BEHIND_FLUSH_SIZE'],
+            flush_interval=app.config['WRITE_BEHIND_FLUSH_INTERVAL'],
+            put_timeout=app.config['WRITE_BEHIND_PUT_TIMEOUT'],
+            max_retries=app.config['WRITE_BEHIND_MAX_RETRIES'],
+            max_backoff=app.config['WRITE_BEHIND_MAX_BACKOFF'],
+            is_transient=is_transient_error,
+        )
+        app.extensions['write_behind'] = write_behind
 
     # User class definition
     class User:
-        def __init__(self, initials, password, role, list_name, group, gender):
+        def __init__(self, initials, password, role, list_name, group, gender, hashed=False):
             self.initials = initials
-            self.password = generate_password_hash(password)
+            self.password = password if hashed else hasher.hash(password)
             self.role = role
             self.list_name = list_name
             self.group = group
@@ -138,6 +400,29 @@ def create_app():
                 SELECT %s, id, 0, 0 FROM levels
             """, (self.initials,))
 
+        @staticmethod
+        def save_many_to_db(cursor, users):
+            # Same rows as save_to_db, written with multi-row executemany.
+            cursor.executemany("""
+                INSERT INTO users (initials, password, role, list, `group`, gender) 
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, [(u.initials, u.password, u.role, u.list_name, u.group, u.gender) for u in users])
+            cursor.executemany("""
+                INSERT INTO statistics (initials, games_played, average_score, highest_score) 
+                VALUES (%s, %s, %s, %s)
+            """, [(u.initials, 0, 0, 0) for u in users])
+            cursor.executemany("""
+                INSERT INTO leaderboard (student_id, highest_score) 
+                VALUES (%s, %s)
+            """, [(u.initials, 0) for u in users])
+            cursor.execute("SELECT id FROM levels")
+            level_ids = [row[0] for row in cursor.fetchall()]
+            if level_ids:
+                cursor.executemany("""
+                    INSERT INTO user_levels (user_initials, level_id, score, tries) 
+                    VALUES (%s, %s, 0, 0)
+                """, [(u.initials, level_id) for u in users for level_id in level_ids])
+
     def _build_cors_prelight_response():
         response = make_response()
         response.headers.add("Access-Control-Allow-Origin", "*")
@@ -238,24 +523,167 @@ def create_app():
             except KeyError as e:
                 return make_response(jsonify({'success': False, 'message': f'Missing data for {str(e)}'}), 400)
 
-            conn = get_db_connection()
-            cursor = conn.cursor()
+            with pool.cursor() as (conn, cursor):
+                try:
+                    exists = pool.prepared_cursor(conn, USER_EXISTS)
+                    exists.execute(USER_EXISTS, (new_user.initials,))
+                    if exists.fetchall():
+                        return make_response(jsonify({'success': False, 'message': 'User already exists.'}), 409)
+
+                    new_user.save_to_db(cursor)
+                    conn.commit()
+                except Exception as e:
+                    print("Error during database operation:", str(e))
+                    return make_response(jsonify({'success': False, 'message': 'Database error occurred'}), 500)
+                data_versions.bump(conn, 'users')
+
+            leaderboard.set_user(new_user.initials, 0, new_user.role, new_user.group, new_user.list_name)
+            response_cache.invalidate('users')
 
+            return make_response(jsonify({'success': True, 'message': 'Registration successful.'}), 201)
+
+    @app.route('/register/bulk', methods=['POST'])
+    @swag_from({
+        'consumes': ['application/json', 'text/csv', 'multipart/form-data'],
+        'parameters': [
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'description': 'A JSON array (or {"users": [...]}) of registration objects, or CSV with a header row '
+                               'initials,password,userType,list,group,gender (also accepted as a "file" upload)',
+                'schema': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'initials': {'type': 'string', 'example': 'jdoe'},
+                            'list': {'type': 'string', 'example': 'list1'},
+                            'userType': {'type': 'string', 'example': 'student'},
+                            'group': {'type': 'string', 'example': 'A'},
+                            'gender': {'type': 'string', 'example': 'male'},
+                            'password': {'type': 'string', 'example': 'password123'}
+                        }
+                    }
+                }
+            }
+        ],
+        'responses': {
+            200: {
+                'description': 'Import finished; one result per submitted row, in order',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'success': {'type': 'boolean'},
+                        'created': {'type': 'integer'},
+                        'results': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'object',
+                                'properties': {
+                                    'row': {'type': 'integer'},
+                                    'initials': {'type': 'string'},
+                                    'status': {'type': 'string', 'enum': ['created', 'duplicate', 'invalid']},
+                                    'message': {'type': 'string'}
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            400: {
+                'description': 'No rows or too many rows'
+            }
+        }
+    })
+    def register_bulk():
+        if 'file' in request.files:
+            rows = list(csv.DictReader(io.StringIO(request.files['file'].read().decode('utf-8-sig'))))
+        elif request.mimetype == 'text/csv':
+            rows = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+        else:
+            data = request.get_json(silent=True)
+            rows = data.get('users') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not rows:
+            return make_response(jsonify({'success': False, 'message': 'No data provided'}), 400)
+        if len(rows) > app.config['ROSTER_IMPORT_MAX']:
+            return make_response(jsonify({
+                'success': False,
+                'message': 'At most %d users per import.' % app.config['ROSTER_IMPORT_MAX']
+            }), 400)
+
+        results = [None] * len(rows)
+        candidates = []
+        seen = set()
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                results[index] = {'row': index, 'status': 'invalid', 'message': 'Each row must be an object'}
+                continue
+            missing = [field for field in ('initials', 'password', 'gender') if not row.get(field)]
+            if missing:
+                results[index] = {'row': index, 'initials': row.get('initials'), 'status': 'invalid',
+                                  'message': 'Missing data for %s' % ', '.join(missing)}
+                continue
+            if row['initials'] in seen:
+                results[index] = {'row': index, 'initials': row['initials'], 'status': 'duplicate',
+                                  'message': 'Repeated in this import.'}
+                continue
+            seen.add(row['initials'])
+            candidates.append((index, row))
+
+        with pool.cursor() as (conn, cursor):
             try:
-                cursor.execute("SELECT * FROM users WHERE initials = %s", (new_user.initials,))
-                if cursor.fetchone():
-                    return make_response(jsonify({'success': False, 'message': 'User already exists.'}), 409)
-                
-                new_user.save_to_db(cursor)
-                conn.commit()
+                existing = set()
+                if candidates:
+                    cursor.execute(
+                        "SELECT initials FROM users WHERE initials IN (%s)" % ','.join(['%s'] * len(candidates)),
+                        tuple(row['initials'] for _, row in candidates)
+                    )
+                    existing = {initials for (initials,) in cursor.fetchall()}
             except Exception as e:
                 print("Error during database operation:", str(e))
                 return make_response(jsonify({'success': False, 'message': 'Database error occurred'}), 500)
-            finally:
-                cursor.close()
-                conn.close()
 
-            return make_response(jsonify({'success': True, 'message': 'Registration successful.'}), 201)
+        new_rows = []
+        for index, row in candidates:
+            if row['initials'] in existing:
+                results[index] = {'row': index, 'initials': row['initials'], 'status': 'duplicate',
+                                  'message': 'User already exists.'}
+            else:
+                new_rows.append((index, row))
+
+        # Hashing happens without holding a database connection.
+        hashes = hasher.hash_many([row['password'] for _, row in new_rows])
+        new_users = [
+            User(
+                initials=row['initials'],
+                password=pwhash,
+                role=row.get('userType') or 'student',
+                list_name=row.get('list', ''),
+                group=row.get('group', ''),
+                gender=row['gender'],
+                hashed=True
+            )
+            for (_, row), pwhash in zip(new_rows, hashes)
+        ]
+
+        if new_users:
+            with pool.cursor() as (conn, cursor):
+                try:
+                    User.save_many_to_db(cursor, new_users)
+                    conn.commit()
+                except Exception as e:
+                    print("Error during database operation:", str(e))
+                    return make_response(jsonify({'success': False, 'message': 'Database error occurred'}), 500)
+                data_versions.bump(conn, 'users')
+
+        for (index, _), user in zip(new_rows, new_users):
+            results[index] = {'row': index, 'initials': user.initials, 'status': 'created'}
+            leaderboard.set_user(user.initials, 0, user.role, user.group, user.list_name)
+        if new_users:
+            response_cache.invalidate('users')
+
+        return jsonify({'success': True, 'created': len(new_users), 'results': results}), 200
 
     @app.route('/login', methods=['POST'])
     @swag_from({
@@ -352,13 +780,20 @@ def create_app():
         if not user_initials or not user_password:
             return make_response(jsonify({'success': False, 'message': 'Missing data.'}), 400)
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("SELECT * FROM users WHERE initials = %s", (user_initials,))
-        user = cursor.fetchone()
+        # The connection goes back to the pool before the (slow) hash check.
+        with pool.prepared(LOGIN_QUERY) as (conn, cursor):
+            cursor.execute(LOGIN_QUERY, (user_initials,))
+            rows = cursor.fetchall()
+            user = dict(zip(cursor.column_names, rows[0])) if rows else None
 
-        if user and check_password_hash(user['password'], user_password):
+        if user and hasher.verify(user['password'], user_password):
+            # Transparently upgrade hashes made with older parameters.
+            if hasher.needs_rehash(user['password']):
+                new_hash = hasher.hash(user_password)
+                with pool.cursor() as (conn, cursor):
+                    cursor.execute(REHASH_PASSWORD, (new_hash, user['initials'], user['password']))
+                    conn.commit()
+                hasher.record_rehash()
             user_info = {
                 'initials': user['initials'],
                 'role': user['role'],
@@ -366,12 +801,8 @@ def create_app():
                 'group': user['group'],
                 'gender': user['gender']
             }
-            cursor.close()
-            conn.close()
             return make_response(jsonify({'success': True, 'message': 'Login successful.', 'user': user_info}), 200)
         else:
-            cursor.close()
-            conn.close()
             return make_response(jsonify({'success': False, 'message': 'Invalid credentials.'}), 401)
 
     @app.route('/data/points', methods=['GET'])
@@ -413,42 +844,17 @@ def create_app():
             }
         }
     })
+    @data_versions.conditional('users', 'objects')
+    @response_cache.cached('users', 'objects')
+    @single_flight.coalesced
+    @admission.limited
     def get_points_data():
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        group = request.args.get('group', '')
-        lists = request.args.getlist('lists')
-        
-        query = """
-            SELECT 
-                u.initials AS usuario_nombre, 
-                u.group AS grupo_nombre, 
-                u.list AS list,
-                u.role AS role,
-                SUM(o.score) AS total_puntuacion
-            FROM users u
-            JOIN objects o ON u.initials = o.user_initials
-        """
-        
-        conditions = []
-        params = []
-        if group:
-            conditions.append("u.group = %s")
-            params.append(group)
-        if lists:
-            conditions.append("u.list IN (%s)" % ','.join(['%s'] * len(lists)))
-            params.extend(lists)
-            
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-            
-        query += " GROUP BY u.initials, u.group, u.list"
-        
-        cursor.execute(query, tuple(params))
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return jsonify(data), 200
+        query, params = user_totals_query([POINTS_COLUMN], request.args.get('group', ''),
+                                          request.args.getlist('lists'))
+        with reads.cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(query, params)
+            data = cursor.fetchall()
+        return json_response(data)
 
     @app.route('/data/time', methods=['GET'])
     @swag_from({
@@ -489,42 +895,17 @@ def create_app():
             }
         }
     })
+    @data_versions.conditional('users', 'objects')
+    @response_cache.cached('users', 'objects')
+    @single_flight.coalesced
+    @admission.limited
     def get_time_data():
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        group = request.args.get('group', '')
-        lists = request.args.getlist('lists')
-        
-        query = """
-            SELECT 
-                u.initials AS usuario_nombre, 
-                u.group AS grupo_nombre, 
-                u.list AS list,
-                u.role AS role,
-                SUM(o.tries * 60) AS total_tiempo  -- Assuming each try is 60 seconds
-            FROM users u
-            JOIN objects o ON u.initials = o.user_initials
-        """
-        
-        conditions = []
-        params = []
-        if group:
-            conditions.append("u.group = %s")
-            params.append(group)
-        if lists:
-            conditions.append("u.list IN (%s)" % ','.join(['%s'] * len(lists)))
-            params.extend(lists)
-            
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-            
-        query += " GROUP BY u.initials, u.group, u.list"
-        
-        cursor.execute(query, tuple(params))
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return jsonify(data), 200
+        query, params = user_totals_query([TIME_COLUMN], request.args.get('group', ''),
+                                          request.args.getlist('lists'))
+        with reads.cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(query, params)
+            data = cursor.fetchall()
+        return json_response(data)
 
     @app.route('/data/groups', methods=['GET'])
     @swag_from({
@@ -553,14 +934,15 @@ def create_app():
             }
         }
     })
+    @data_versions.conditional('users')
+    @response_cache.cached('users')
+    @single_flight.coalesced
+    @admission.limited
     def get_groups():
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT DISTINCT `group` AS group_name FROM users")
-        groups = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return jsonify(groups), 200
+        with reads.cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(GROUPS_QUERY)
+            groups = cursor.fetchall()
+        return json_response(groups)
 
     @app.route('/data/lists', methods=['GET'])
     @swag_from({
@@ -589,24 +971,103 @@ def create_app():
             }
         }
     })
+    @data_versions.conditional('users')
+    @response_cache.cached('users')
+    @single_flight.coalesced
+    @admission.limited
     def get_lists():
+        query, params = lists_query(request.args.get('group', ''))
+        with reads.cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(query, params)
+            lists = cursor.fetchall()
+        return json_response(lists)
+
+    @app.route('/data/dashboard', methods=['GET'])
+    @swag_from({
+        'parameters': [
+            {'name': 'group', 'in': 'query', 'type': 'string', 'required': False},
+            {'name': 'lists', 'in': 'query', 'type': 'array', 'items': {'type': 'string'},
+             'collectionFormat': 'multi', 'required': False}
+        ],
+        'responses': {
+            200: {
+                'description': 'Points, time and group/list facets for the professor dashboard in one response. '
+                               '`users` combines /data/points and /data/time, `groups` matches /data/groups and '
+                               '`lists` matches /data/lists for the requested group.',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'users': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'object',
+                                'properties': {
+                                    'usuario_nombre': {'type': 'string'},
+                                    'grupo_nombre': {'type': 'string'},
+                                    'list': {'type': 'string'},
+                                    'role': {'type': 'string'},
+                                    'total_puntuacion': {'type': 'number'},
+                                    'total_tiempo': {'type': 'number'}
+                                }
+                            }
+                        },
+                        'groups': {
+                            'type': 'array',
+                            'items': {'type': 'object', 'properties': {'group_name': {'type': 'string'}}}
+                        },
+                        'lists': {
+                            'type': 'array',
+                            'items': {'type': 'object', 'properties': {'list': {'type': 'string'}}}
+                        }
+                    }
+                }
+            },
+            'examples': {
+                'application/json': {
+                    'users': [
+                        {
+                            'usuario_nombre': 'John',
+                            'grupo_nombre': 'A',
+                            'list': 'list1',
+                            'role': 'student',
+                            'total_puntuacion': 90,
+                            'total_tiempo': 120
+                        }
+                    ],
+                    'groups': [{'group_name': 'A'}, {'group_name': 'B'}],
+                    'lists': [{'list': 'list1'}, {'list': 'list2'}]
+                }
+            }
+        }
+    })
+    @data_versions.conditional('users', 'objects')
+    @response_cache.cached('users', 'objects')
+    @single_flight.coalesced
+    @admission.limited
+    def get_dashboard_data():
         group = request.args.get('group', '')
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        if group:
-            cursor.execute("SELECT DISTINCT `list` FROM users WHERE `group` = %s", (group,))
-        else:
-            cursor.execute("SELECT DISTINCT `list` FROM users")
-        lists = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return jsonify(lists), 200
+        query, params = user_totals_query([POINTS_COLUMN, TIME_COLUMN], group, request.args.getlist('lists'))
+        with reads.cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(query, params)
+            users = cursor.fetchall()
+            cursor.execute(FACETS_QUERY)
+            groups, lists = dashboard_facets(cursor.fetchall(), group)
+        return json_response({'users': users, 'groups': groups, 'lists': lists})
 
     @app.route('/data/leaderboard', methods=['GET'])
     @swag_from({
+        'parameters': [
+            {'name': 'limit', 'in': 'query', 'type': 'integer', 'required': False},
+            {'name': 'cursor', 'in': 'query', 'type': 'string', 'required': False,
+             'description': 'Value of the X-Next-Cursor header from the previous page'},
+            {'name': 'group', 'in': 'query', 'type': 'string', 'required': False},
+            {'name': 'lists', 'in': 'query', 'type': 'array', 'items': {'type': 'string'},
+             'collectionFormat': 'multi', 'required': False}
+        ],
         'responses': {
             200: {
-                'description': 'Leaderboard data',
+                'description': 'Leaderboard data, highest score first. When more rows are available the '
+                               'X-Next-Cursor response header holds the cursor for the next page.',
                 'schema': {
                     'type': 'array',
                     'items': {
@@ -635,22 +1096,60 @@ def create_app():
             }
         }
     })
+    @data_versions.conditional(etag=leaderboard.etag)
+    @single_flight.coalesced
     def get_leaderboard():
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT 
-                u.initials AS usuario_nombre, 
-                l.highest_score,
-                u.role AS role
-            FROM users u
-            JOIN leaderboard l ON u.initials = l.student_id
-            ORDER BY l.highest_score DESC
-        """)
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return jsonify(data), 200
+        group = request.args.get('group', '')
+        lists = request.args.getlist('lists')
+        try:
+            limit = request.args.get('limit', type=int)
+            if limit is not None and limit <= 0:
+                raise ValueError('limit must be positive')
+            data, next_cursor = leaderboard.page(limit, request.args.get('cursor'), group, lists)
+        except ValueError as e:
+            return make_response(jsonify({'success': False, 'message': str(e)}), 400)
+
+        response = json_response(data)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    @app.route('/data/leaderboard/rank/<user_initials>', methods=['GET'])
+    @swag_from({
+        'parameters': [
+            {'name': 'user_initials', 'in': 'path', 'type': 'string', 'required': True},
+            {'name': 'group', 'in': 'query', 'type': 'string', 'required': False},
+            {'name': 'lists', 'in': 'query', 'type': 'array', 'items': {'type': 'string'},
+             'collectionFormat': 'multi', 'required': False}
+        ],
+        'responses': {
+            200: {
+                'description': 'Rank of a user on the leaderboard (1 is the highest score)',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'usuario_nombre': {'type': 'string'},
+                        'highest_score': {'type': 'number'},
+                        'role': {'type': 'string'},
+                        'rank': {'type': 'integer'},
+                        'total': {'type': 'integer'}
+                    }
+                }
+            },
+            404: {
+                'description': 'User not found'
+            }
+        }
+    })
+    @data_versions.conditional(etag=leaderboard.etag)
+    @single_flight.coalesced
+    def get_leaderboard_rank(user_initials):
+        group = request.args.get('group', '')
+        lists = request.args.getlist('lists')
+        data = leaderboard.rank(user_initials, group, lists)
+        if data is None:
+            return make_response(jsonify({'success': False, 'message': 'User not found.'}), 404)
+        return json_response(data)
 
     @app.route('/user_levels/<user_initials>', methods=['PUT'])
     @swag_from({
@@ -664,6 +1163,12 @@ def create_app():
                     }
                 }
             },
+            202: {
+                'description': 'Update accepted and queued (write-behind mode)'
+            },
+            503: {
+                'description': 'Write-behind buffer is full; retry after the Retry-After delay'
+            },
             'examples': {
                 'application/json': {
                     'message': 'User level updated successfully'
@@ -673,26 +1178,153 @@ def create_app():
     })
     def update_user_level(user_initials):
         data = request.get_json()
-        level_id = data.get('level_id')
-        score = data.get('score', 0)
-        tries = data.get('tries', 0)
-        completed = data.get('completed', False)
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE user_levels
-            SET score = %s, tries = %s, completed = %s
-            WHERE user_initials = %s AND level_id = %s
-        """, (score, tries, completed, user_initials, level_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        try:
+            update = normalize_level_update(data, user_initials)
+        except ValueError as e:
+            return make_response(jsonify({'success': False, 'message': str(e)}), 400)
+
+        if write_behind is not None:
+            try:
+                write_behind.submit(update)
+            except BufferFull:
+                response = make_response(jsonify({'success': False, 'message': 'Server busy, try again.'}), 503)
+                response.headers['Retry-After'] = '1'
+                return response
+            return jsonify({'message': 'User level update accepted'}), 202
+
+        with pool.cursor() as (conn, cursor):
+            statement = pool.prepared_cursor(conn, UPDATE_USER_LEVEL)
+            statement.execute(UPDATE_USER_LEVEL, (update['score'], update['tries'], update['completed'], user_initials, update['level_id']))
+            # rowcount (matched rows, see db_config) is 0 only for unknown keys.
+            # Every applied write is a score event, replays included, as in
+            # the batch and write-behind paths.
+            updated = statement.rowcount > 0
+            if updated:
+                record_score_events(cursor, [update])
+            conn.commit()
+            if updated:
+                data_versions.bump(conn, 'scores')
+        if updated:
+            leaderboard.update_score(user_initials, update['score'])
+            response_cache.invalidate('scores')
         return jsonify({'message': 'User level updated successfully'}), 200
 
+    @app.route('/user_levels', methods=['POST'])
+    @swag_from({
+        'parameters': [
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'updates': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'object',
+                                'properties': {
+                                    'user_initials': {'type': 'string', 'example': 'jdoe'},
+                                    'level_id': {'type': 'integer', 'example': 1},
+                                    'score': {'type': 'number', 'example': 90},
+                                    'tries': {'type': 'integer', 'example': 3},
+                                    'completed': {'type': 'boolean', 'example': True}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        ],
+        'responses': {
+            200: {
+                'description': 'Batch applied in one transaction; one result per submitted update, in order. '
+                               'Like PUT /user_levels/<user_initials>, only existing progress rows are updated '
+                               '(not_found otherwise); out-of-range values are reported as invalid per item',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'success': {'type': 'boolean'},
+                        'applied': {'type': 'integer'},
+                        'results': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'object',
+                                'properties': {
+                                    'index': {'type': 'integer'},
+                                    'status': {'type': 'string', 'enum': ['applied', 'superseded', 'invalid', 'not_found']},
+                                    'message': {'type': 'string'}
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            400: {
+                'description': 'Missing data or batch too large'
+            }
+        }
+    })
+    def update_user_levels_batch():
+        data = request.get_json(silent=True)
+        items = data.get('updates') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return make_response(jsonify({'success': False, 'message': 'No updates provided'}), 400)
+        if len(items) > app.config['USER_LEVELS_BATCH_MAX']:
+            return make_response(jsonify({
+                'success': False,
+                'message': 'At most %d updates per batch.' % app.config['USER_LEVELS_BATCH_MAX']
+            }), 400)
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                update = normalize_level_update(item)
+            except ValueError as e:
+                results[index] = {'index': index, 'status': 'invalid', 'message': str(e)}
+                continue
+            update['index'] = index
+            valid.append(update)
+
+        # Repeated updates to the same (user, level) collapse to the last one.
+        latest = collapse_level_updates(valid)
+        for update in valid:
+            if latest[(update['user_initials'], update['level_id'])] is not update:
+                results[update['index']] = {'index': update['index'], 'status': 'superseded'}
+
+        try:
+            found = write_level_updates(list(latest.values()))
+        except Exception as e:
+            print("Error during database operation:", str(e))
+            return make_response(jsonify({'success': False, 'message': 'Database error occurred'}), 500)
+
+        applied = 0
+        for key, update in latest.items():
+            if key in found:
+                results[update['index']] = {'index': update['index'], 'status': 'applied'}
+                applied += 1
+            else:
+                results[update['index']] = {'index': update['index'], 'status': 'not_found',
+                                            'message': 'No progress row for this user and level'}
+
+        return jsonify({'success': True, 'applied': applied, 'results': results}), 200
+
     # New endpoint to fetch group comparison data
     @app.route('/data/group-comparison', methods=['GET'])
     @swag_from({
+        'parameters': [
+            {'name': 'groups', 'in': 'query', 'type': 'array', 'items': {'type': 'string'},
+             'collectionFormat': 'multi', 'required': False, 'description': 'Defaults to A, B, C and D'},
+            {'name': 'lists', 'in': 'query', 'type': 'array', 'items': {'type': 'string'},
+             'collectionFormat': 'multi', 'required': False},
+            {'name': 'stream', 'in': 'query', 'type': 'boolean', 'required': False,
+             'description': 'Stream the JSON while reading rows with a server-side cursor'},
+            {'name': 'summary', 'in': 'query', 'type': 'boolean', 'required': False,
+             'description': 'Return per-group count, mean, stddev, quantiles and a histogram instead of raw scores'},
+            {'name': 'bins', 'in': 'query', 'type': 'integer', 'required': False,
+             'description': 'Number of histogram bins in summary mode (default 10)'}
+        ],
         'responses': {
             200: {
                 'description': 'Group comparison data',
@@ -721,35 +1353,223 @@ def create_app():
             }
         }
     })
+    @data_versions.conditional('users', 'objects')
+    @response_cache.cached('users', 'objects')
+    @single_flight.coalesced
+    @admission.limited
     def get_group_comparison_data():
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-            SELECT 
-                u.group AS `group`, 
-                o.score 
-            FROM users u
-            JOIN objects o ON u.initials = o.user_initials
-            WHERE u.group IN ('A', 'B', 'C', 'D')
-        """
-        
-        cursor.execute(query)
-        results = cursor.fetchall()
-        
-        group_data = {}
-        for result in results:
-            group = result['group']
-            score = result['score']
-            if group not in group_data:
-                group_data[group] = []
-            group_data[group].append(score)
-        
-        group_comparison_data = [{'group': group, 'scores': scores} for group, scores in group_data.items()]
-        
-        cursor.close()
-        conn.close()
-        return jsonify(group_comparison_data), 200
+        groups = request.args.getlist('groups') or list(app.config['GROUP_COMPARISON_DEFAULT_GROUPS'])
+        where, params = group_comparison_where(groups, request.args.getlist('lists'))
+
+        if request.args.get('summary', '').lower() in ('1', 'true'):
+            bins = request.args.get('bins', 10, type=int)
+            if not 1 <= bins <= 100:
+                return make_response(jsonify({'success': False, 'message': 'bins must be between 1 and 100'}), 400)
+            with reads.cursor() as (conn, cursor):
+                data = group_score_summary(cursor, where, params, bins)
+            return json_response(data)
+
+        query = group_scores_query(where)
+
+        if request.args.get('stream', '').lower() in ('1', 'true'):
+            chunks = stream_group_scores(reads, query + " ORDER BY u.group", params,
+                                         app.config['GROUP_COMPARISON_STREAM_CHUNK'])
+            return Response(chunks, mimetype='application/json')
+
+        with reads.cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+        return json_response(group_scores(results))
+
+    @app.route('/stats/pool', methods=['GET'])
+    @swag_from({
+        'responses': {
+            200: {
+                'description': 'Connection pool statistics for this worker process',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'size': {'type': 'integer'},
+                        'max_overflow': {'type': 'integer'},
+                        'open': {'type': 'integer'},
+                        'idle': {'type': 'integer'},
+                        'in_use': {'type': 'integer'},
+                        'waiting': {'type': 'integer'},
+                        'checkouts': {'type': 'integer'},
+                        'timeouts': {'type': 'integer'},
+                        'discarded': {'type': 'integer'},
+                        'wait_time_total': {'type': 'number'},
+                        'wait_time_max': {'type': 'number'},
+                        'wait_time_avg': {'type': 'number'},
+                        'prepared_hits': {'type': 'integer'},
+                        'prepared_misses': {'type': 'integer'},
+                        'prepared_evictions': {'type': 'integer'}
+                    }
+                }
+            }
+        }
+    })
+    def get_pool_stats():
+        stats = pool.stats()
+        stats['pid'] = os.getpid()
+        return jsonify(stats), 200
+
+    @app.route('/stats/replica', methods=['GET'])
+    @swag_from({
+        'responses': {
+            200: {
+                'description': 'Read routing statistics for this worker process',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'replica_configured': {'type': 'boolean'},
+                        'replica_healthy': {'type': 'boolean'},
+                        'lag_check': {'type': 'boolean'},
+                        'replica_lag': {'type': 'number'},
+                        'replica_reads': {'type': 'integer'},
+                        'primary_reads': {'type': 'integer'},
+                        'fallbacks': {'type': 'integer'},
+                        'pool': {'type': 'object'}
+                    }
+                }
+            }
+        }
+    })
+    def get_replica_stats():
+        stats = reads.stats()
+        stats['pool'] = replica.stats() if replica is not None else None
+        stats['pid'] = os.getpid()
+        return jsonify(stats), 200
+
+    @app.route('/stats/write-behind', methods=['GET'])
+    @swag_from({
+        'responses': {
+            200: {
+                'description': 'Write-behind buffer statistics for this worker process',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'enabled': {'type': 'boolean'},
+                        'depth': {'type': 'integer'},
+                        'max_depth': {'type': 'integer'},
+                        'submitted': {'type': 'integer'},
+                        'collapsed': {'type': 'integer'},
+                        'rejected': {'type': 'integer'},
+                        'flushed': {'type': 'integer'},
+                        'flushes': {'type': 'integer'},
+                        'failures': {'type': 'integer'},
+                        'requeued': {'type': 'integer'},
+                        'dropped': {'type': 'integer'},
+                        'dead_letters': {'type': 'array', 'items': {'type': 'object'}},
+                        'backoff': {'type': 'number'},
+                        'flush_time_avg': {'type': 'number'},
+                        'flush_time_max': {'type': 'number'},
+                        'flush_time_last': {'type': 'number'}
+                    }
+                }
+            }
+        }
+    })
+    def get_write_behind_stats():
+        stats = write_behind.stats() if write_behind is not None else {}
+        stats['enabled'] = write_behind is not None
+        stats['pid'] = os.getpid()
+        return jsonify(stats), 200
+
+    @app.route('/stats/passwords', methods=['GET'])
+    @swag_from({
+        'responses': {
+            200: {
+                'description': 'Password hashing pool statistics for this worker process',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'workers': {'type': 'integer'},
+                        'max_in_flight': {'type': 'integer'},
+                        'bulk_in_flight': {'type': 'integer'},
+                        'method': {'type': 'string'},
+                        'operations': {'type': 'integer'},
+                        'rejected': {'type': 'integer'},
+                        'rehashed': {'type': 'integer'},
+                        'hash_time_avg': {'type': 'number'},
+                        'hash_time_max': {'type': 'number'},
+                        'wait_time_avg': {'type': 'number'},
+                        'wait_time_max': {'type': 'number'}
+                    }
+                }
+            }
+        }
+    })
+    def get_password_stats():
+        stats = hasher.stats()
+        stats['pid'] = os.getpid()
+        return jsonify(stats), 200
+
+    @app.route('/stats/cache', methods=['GET'])
+    @swag_from({
+        'responses': {
+            200: {
+                'description': 'Response cache statistics for this worker process',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'enabled': {'type': 'boolean'},
+                        'entries': {'type': 'integer'},
+                        'hits': {'type': 'integer'},
+                        'misses': {'type': 'integer'},
+                        'hit_ratio': {'type': 'number'},
+                        'evictions': {'type': 'integer'},
+                        'expirations': {'type': 'integer'},
+                        'invalidations': {'type': 'integer'},
+                        'single_flight': {
+                            'type': 'object',
+                            'properties': {
+                                'enabled': {'type': 'boolean'},
+                                'in_flight': {'type': 'integer'},
+                                'leaders': {'type': 'integer'},
+                                'shared': {'type': 'integer'},
+                                'timeouts': {'type': 'integer'}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    })
+    def get_cache_stats():
+        stats = response_cache.stats()
+        stats['single_flight'] = single_flight.stats()
+        stats['pid'] = os.getpid()
+        return jsonify(stats), 200
+
+    @app.route('/stats/admission', methods=['GET'])
+    @swag_from({
+        'responses': {
+            200: {
+                'description': 'Rate limiting and /data/* concurrency statistics for this worker process',
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'max_concurrency': {'type': 'integer'},
+                        'in_flight': {'type': 'integer'},
+                        'admitted': {'type': 'integer'},
+                        'clients': {'type': 'integer'},
+                        'rate_limited': {'type': 'object', 'additionalProperties': {'type': 'integer'}},
+                        'overloaded': {'type': 'object', 'additionalProperties': {'type': 'integer'}},
+                        'shed': {'type': 'integer'}
+                    }
+                }
+            }
+        }
+    })
+    def get_admission_stats():
+        stats = admission.stats()
+        stats['pid'] = os.getpid()
+        return jsonify(stats), 200
+
+    # Last, so the docs see every route.
+    if app.config['API_DOCS'] != 'off':
+        docs.init_app(app)
 
     return app
 
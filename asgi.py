@@ -0,0 +1,609 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import wraps
+
+import aiomysql
+from pymysql.constants import CLIENT
+from a2wsgi import WSGIMiddleware
+from quart import Quart, Response, g, request, jsonify, make_response
+from quart.wrappers.response import DataBody
+from werkzeug.exceptions import HTTPException
+
+from app import create_app
+from admission import RateLimited, Overloaded, client_address
+from aggregates import record_score_events
+from cache import request_key, shareable_headers
+from db import PoolTimeout
+from encoding import COMPRESSIBLE_TYPES, negotiate_encoding, compress
+from metrics import REQUEST_LATENCY
+from passwords import HasherBusy
+from progress import normalize_level_update
+from queries import (POINTS_COLUMN, TIME_COLUMN, GROUPS_QUERY, FACETS_QUERY, LOGIN_QUERY, REHASH_PASSWORD,
+                     UPDATE_USER_LEVEL, user_totals_query, lists_query, dashboard_facets,
+                     group_comparison_where, group_scores_query, group_scores)
+from routing import READ_YOUR_WRITES_HEADER
+from streaming import stream_group_scores
+from summary import group_score_summary
+from versions import bump_statement, format_etag
+from writebehind import BufferFull
+
+# Alternate ASGI entry point. The hot routes (login, score updates and the
+# /data/* dashboards) run as coroutines on an aiomysql pool, so thousands of
+# in-flight requests share a few event-loop workers:
+#
+#     gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker -w 2 'asgi:create_async_app()'
+#
+# Every other route (register, docs, leaderboard pages, stats, metrics, ...)
+# is served by the regular Flask app on a thread pool, so both modes expose
+# the same routes and JSON contracts and share per-process state (password
+# hasher, leaderboard, response cache, write-behind buffer).
+
+class StatementLog:
+    # Cursor stand-in for the write helpers shared with the WSGI app (e.g.
+    # record_score_events): records what they execute so it can be replayed
+    # on an aiomysql cursor. Only for helpers that never fetch.
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, operation, params=()):
+        self.statements.append((operation, params))
+
+    async def replay(self, cursor):
+        for operation, params in self.statements:
+            await cursor.execute(operation, params)
+
+
+class AsyncConnectionPool:
+    # aiomysql pool raising PoolTimeout like ConnectionPool. Connections run
+    # in autocommit mode, so reads need no rollback; writes spanning several
+    # statements call conn.begin(). aiomysql closes connections released
+    # inside a transaction (after an error). The pool is opened on the
+    # serving event loop, i.e. after gunicorn forks.
+    def __init__(self, db_config, minsize=5, maxsize=20, timeout=30, recycle=3600):
+        self.db_config = db_config
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.recycle = recycle
+        self._pool = None
+
+    async def open(self):
+        self._pool = await aiomysql.create_pool(
+            host=self.db_config['host'],
+            port=self.db_config['port'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            db=self.db_config['database'],
+            minsize=self.minsize,
+            maxsize=self.maxsize,
+            pool_recycle=self.recycle,
+            autocommit=True,
+            # Matched rather than changed rows, as in the Flask app.
+            client_flag=CLIENT.FOUND_ROWS,
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+
+    @asynccontextmanager
+    async def cursor(self, dictionary=False):
+        try:
+            conn = await asyncio.wait_for(self._pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout('Timed out waiting for a database connection')
+        try:
+            async with conn.cursor(aiomysql.DictCursor if dictionary else aiomysql.Cursor) as cursor:
+                yield conn, cursor
+        finally:
+            self._pool.release(conn)
+
+    def stats(self):
+        return {
+            'size': self._pool.size if self._pool else 0,
+            'idle': self._pool.freesize if self._pool else 0,
+            'min_size': self.minsize,
+            'max_size': self.maxsize,
+        }
+
+
+class AsyncDataVersions:
+    # asyncio counterpart of versions.DataVersions. ETags use the same format,
+    # so cache entries and If-None-Match values are valid in both apps.
+    def __init__(self, pool, max_age=1.0, shared=None):
+        self.pool = pool
+        self.max_age = max_age
+        self.shared = shared
+        self._versions = None
+        self._read_at = 0.0
+
+    async def current(self):
+        if self._versions is not None and time.monotonic() - self._read_at < self.max_age:
+            return self._versions
+        async with self.pool.cursor() as (conn, cursor):
+            await cursor.execute("SELECT name, version FROM data_versions")
+            versions = dict(await cursor.fetchall())
+        self._versions = versions
+        self._read_at = time.monotonic()
+        return versions
+
+    async def bump(self, conn, *names):
+        async with conn.cursor() as cursor:
+            await cursor.execute(*bump_statement(names))
+        await conn.commit()
+        self._versions = None
+        if self.shared is not None:
+            self.shared.invalidate()
+
+    async def etag(self, tags):
+        return format_etag(await self.current(), tags)
+
+    def conditional(self, *tags):
+        def decorator(view):
+            @wraps(view)
+            async def wrapper(*args, **kwargs):
+                etag = await self.etag(tags)
+                if request.if_none_match.contains_weak(etag):
+                    response = await make_response('', 304)
+                    response.set_etag(etag)
+                    return response
+                response = await make_response(await view(*args, **kwargs))
+                if response.status_code == 200:
+                    response.set_etag(etag)
+                return response
+            return wrapper
+        return decorator
+
+
+def cached(response_cache, versions, *tags):
+    # ResponseCache.cached for coroutine views, on the Flask app's cache so
+    # both apps see the same entries and invalidations.
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if not response_cache.enabled:
+                return await view(*args, **kwargs)
+            key = request_key(request)
+            token = await versions.etag(tags)
+            entry = response_cache.get(key, token)
+            if entry is not None:
+                return await make_response(entry['body'], entry['status'], entry['headers'])
+            generation = response_cache.generation
+            response = await make_response(await view(*args, **kwargs))
+            if response.status_code == 200 and isinstance(response.response, DataBody):
+                response_cache.set(key, tags, await response.get_data(), response.status_code,
+                                   shareable_headers(response), generation, token)
+            return response
+        return wrapper
+    return decorator
+
+
+class AsyncSingleFlight:
+    # singleflight.SingleFlight for coroutine views: identical concurrent
+    # requests await the first one's serialized response.
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._calls = {}
+        self._leaders = 0
+        self._shared = 0
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'in_flight': len(self._calls),
+            'leaders': self._leaders,
+            'shared': self._shared,
+        }
+
+    def coalesced(self, view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return await view(*args, **kwargs)
+            key = request_key(request)
+            call = self._calls.get(key)
+            if call is not None:
+                result = await asyncio.shield(call)
+                if result is None:
+                    return await view(*args, **kwargs)
+                self._shared += 1
+                body, status, headers = result
+                return await make_response(body, status, headers)
+
+            call = self._calls[key] = asyncio.get_running_loop().create_future()
+            self._leaders += 1
+            try:
+                response = await make_response(await view(*args, **kwargs))
+                result = None
+                if isinstance(response.response, DataBody):
+                    result = (await response.get_data(), response.status_code, shareable_headers(response))
+                call.set_result(result)
+                return response
+            except Exception as e:
+                call.set_exception(e)
+                # Marks the exception retrieved when nobody was waiting.
+                call.exception()
+                raise
+            except BaseException:
+                # Leader cancelled: followers run the view themselves.
+                call.set_result(None)
+                raise
+            finally:
+                del self._calls[key]
+        return wrapper
+
+
+class AsyncConcurrencyLimit:
+    # AdmissionControl.limited for coroutine views: at most
+    # `admission.max_concurrency` run at once on this event loop, others wait
+    # up to `admission.queue_timeout` seconds for a slot and then raise
+    # Overloaded. Streamed group comparisons read on the Flask app's pool in
+    # the executor, which bounds them already, so slots are freed when the
+    # view returns.
+    def __init__(self, admission):
+        self.admission = admission
+        self._slots = asyncio.Semaphore(admission.max_concurrency) if admission.max_concurrency else None
+        self._in_flight = 0
+        self._admitted = 0
+
+    def stats(self):
+        return {
+            'max_concurrency': self.admission.max_concurrency,
+            'in_flight': self._in_flight,
+            'admitted': self._admitted,
+        }
+
+    def limited(self, view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if self._slots is not None:
+                if not self._slots.locked():
+                    await self._slots.acquire()
+                else:
+                    try:
+                        await asyncio.wait_for(self._slots.acquire(), self.admission.queue_timeout)
+                    except asyncio.TimeoutError:
+                        self.admission.shed(request.endpoint, 'overloaded')
+                        raise Overloaded()
+            self._admitted += 1
+            self._in_flight += 1
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                self._in_flight -= 1
+                if self._slots is not None:
+                    self._slots.release()
+        return wrapper
+
+
+class Dispatcher:
+    # Sends requests for routes of the Quart app to it and everything else
+    # (including CORS preflights, answered by flask_cors) to the Flask app.
+    def __init__(self, async_app, flask_app, threads=10):
+        self.async_app = async_app
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=threads)
+        self._urls = async_app.url_map.bind('localhost')
+
+    def _is_async(self, scope):
+        if scope['method'] == 'OPTIONS':
+            return False
+        try:
+            self._urls.match(scope['path'], method=scope['method'])
+            return True
+        except HTTPException:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self._is_async(scope):
+            return await self.wsgi(scope, receive, send)
+        return await self.async_app(scope, receive, send)
+
+
+def create_async_app(config=None):
+    flask_app = create_app(config)
+    app = Quart(__name__, static_folder=None)
+    app.config.update(flask_app.config)
+
+    pool = AsyncConnectionPool(
+        {
+            'host': app.config['DB_HOST'],
+            'port': app.config['DB_PORT'],
+            'user': app.config['DB_USER'],
+            'password': app.config['DB_PASSWORD'],
+            'database': app.config['DB_NAME'],
+        },
+        minsize=app.config['ASYNC_DB_POOL_MIN'],
+        maxsize=app.config['ASYNC_DB_POOL_MAX'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        recycle=app.config['DB_POOL_RECYCLE'],
+    )
+    app.extensions['db_pool'] = pool
+
+    hasher = flask_app.extensions['password_hasher']
+    leaderboard = flask_app.extensions['leaderboard']
+    response_cache = flask_app.extensions['response_cache']
+    write_behind = flask_app.extensions.get('write_behind')
+    reads = flask_app.extensions['db_reads']
+
+    data_versions = AsyncDataVersions(pool, max_age=app.config['DATA_VERSION_MAX_AGE'],
+                                      shared=flask_app.extensions['data_versions'])
+    single_flight = AsyncSingleFlight(enabled=app.config['SINGLE_FLIGHT_ENABLED'])
+    admission = flask_app.extensions['admission']
+    concurrency = AsyncConcurrencyLimit(admission)
+    json_codec = flask_app.extensions['json_codec']
+
+    def json_response(data, status=200):
+        return Response(json_codec.dumps(data), status=status, mimetype='application/json')
+
+    async def in_thread(fn, *args):
+        # Password hashing and the synchronous helpers block, so they run on
+        # the default executor instead of the event loop.
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    @app.before_serving
+    async def open_pool():
+        await pool.open()
+
+    @app.after_serving
+    async def close_pool():
+        await pool.close()
+
+    @app.errorhandler(PoolTimeout)
+    async def handle_pool_timeout(e):
+        return await make_response(jsonify({'success': False, 'message': 'Server busy, try again.'}), 503)
+
+    @app.errorhandler(HasherBusy)
+    async def handle_hasher_busy(e):
+        response = await make_response(jsonify({'success': False, 'message': 'Server busy, try again.'}), 503)
+        response.headers['Retry-After'] = '1'
+        return response
+
+    async def compress_response(response):
+        # encoding.init_app for the Quart routes.
+        if (response.status_code != 200 or not isinstance(response.response, DataBody)
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+            return
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.accept_encodings)
+        data = await response.get_data()
+        if encoding is None or len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return
+        response.set_data(compress(data, encoding, app.config['COMPRESS_GZIP_LEVEL'],
+                                   app.config['COMPRESS_BROTLI_QUALITY']))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+    @app.errorhandler(RateLimited)
+    async def handle_rate_limited(e):
+        response = await make_response(jsonify({'success': False, 'message': 'Too many requests, slow down.'}), 429)
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+    @app.errorhandler(Overloaded)
+    async def handle_overloaded(e):
+        response = await make_response(jsonify({'success': False, 'message': 'Server busy, try again.'}), 503)
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+    @app.before_request
+    async def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.before_request
+    async def check_rate_limit():
+        # Shares the Flask app's token buckets, so limits hold across both.
+        if request.path.startswith('/stats/'):
+            return
+        admission.check_rate(client_address(request, app.config['RATE_LIMIT_PROXY_HOPS']), request.endpoint)
+
+    @app.after_request
+    async def finish_request(response):
+        # Same CORS policy, read-your-writes cookie, compression and request
+        # metrics as the Flask app.
+        origin = request.headers.get('Origin')
+        if origin == 'http://localhost:3000':
+            response.headers['Access-Control-Allow-Origin'] = origin
+            response.headers['Access-Control-Expose-Headers'] = READ_YOUR_WRITES_HEADER
+            response.vary.add('Origin')
+        if request.endpoint == 'update_user_level' and response.status_code < 400:
+            reads.mark_write(response)
+        if app.config['COMPRESS_ENABLED']:
+            await compress_response(response)
+        started = g.pop('request_started', None)
+        if app.config['METRICS_ENABLED'] and started is not None and request.url_rule is not None:
+            REQUEST_LATENCY.labels(request.url_rule.rule, request.method, response.status_code).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+    def dashboard(*tags):
+        def decorator(view):
+            return data_versions.conditional(*tags)(
+                cached(response_cache, data_versions, *tags)(single_flight.coalesced(concurrency.limited(view))))
+        return decorator
+
+    @app.route('/login', methods=['POST'])
+    async def login():
+        data = await request.get_json()
+        if not data:
+            return await make_response(jsonify({'success': False, 'message': 'No data provided'}), 400)
+        user_initials = data.get('initials')
+        user_password = data.get('password')
+
+        if not user_initials or not user_password:
+            return await make_response(jsonify({'success': False, 'message': 'Missing data.'}), 400)
+
+        async with pool.cursor(dictionary=True) as (conn, cursor):
+            await cursor.execute(LOGIN_QUERY, (user_initials,))
+            user = await cursor.fetchone()
+
+        if user and await in_thread(hasher.verify, user['password'], user_password):
+            if hasher.needs_rehash(user['password']):
+                new_hash = await in_thread(hasher.hash, user_password)
+                async with pool.cursor() as (conn, cursor):
+                    await cursor.execute(REHASH_PASSWORD, (new_hash, user['initials'], user['password']))
+                    await conn.commit()
+                hasher.record_rehash()
+            user_info = {
+                'initials': user['initials'],
+                'role': user['role'],
+                'list': user['list'],
+                'group': user['group'],
+                'gender': user['gender']
+            }
+            return await make_response(jsonify({'success': True, 'message': 'Login successful.', 'user': user_info}), 200)
+        return await make_response(jsonify({'success': False, 'message': 'Invalid credentials.'}), 401)
+
+    @app.route('/user_levels/<user_initials>', methods=['PUT'])
+    async def update_user_level(user_initials):
+        data = await request.get_json()
+        try:
+            update = normalize_level_update(data, user_initials)
+        except ValueError as e:
+            return await make_response(jsonify({'success': False, 'message': str(e)}), 400)
+
+        if write_behind is not None:
+            try:
+                await in_thread(write_behind.submit, update)
+            except BufferFull:
+                response = await make_response(jsonify({'success': False, 'message': 'Server busy, try again.'}), 503)
+                response.headers['Retry-After'] = '1'
+                return response
+            return jsonify({'message': 'User level update accepted'}), 202
+
+        async with pool.cursor() as (conn, cursor):
+            await conn.begin()
+            await cursor.execute(UPDATE_USER_LEVEL, (update['score'], update['tries'], update['completed'],
+                                                     user_initials, update['level_id']))
+            updated = cursor.rowcount > 0
+            if updated:
+                events = StatementLog()
+                record_score_events(events, [update])
+                await events.replay(cursor)
+            await conn.commit()
+            if updated:
+                await data_versions.bump(conn, 'scores')
+        if updated:
+            leaderboard.update_score(user_initials, update['score'])
+            response_cache.invalidate('scores')
+        return jsonify({'message': 'User level updated successfully'}), 200
+
+    @app.route('/data/points', methods=['GET'])
+    @dashboard('users', 'objects')
+    async def get_points_data():
+        query, params = user_totals_query([POINTS_COLUMN], request.args.get('group', ''),
+                                          request.args.getlist('lists'))
+        async with pool.cursor(dictionary=True) as (conn, cursor):
+            await cursor.execute(query, params)
+            data = await cursor.fetchall()
+        return json_response(data)
+
+    @app.route('/data/time', methods=['GET'])
+    @dashboard('users', 'objects')
+    async def get_time_data():
+        query, params = user_totals_query([TIME_COLUMN], request.args.get('group', ''),
+                                          request.args.getlist('lists'))
+        async with pool.cursor(dictionary=True) as (conn, cursor):
+            await cursor.execute(query, params)
+            data = await cursor.fetchall()
+        return json_response(data)
+
+    @app.route('/data/groups', methods=['GET'])
+    @dashboard('users')
+    async def get_groups():
+        async with pool.cursor(dictionary=True) as (conn, cursor):
+            await cursor.execute(GROUPS_QUERY)
+            groups = await cursor.fetchall()
+        return json_response(groups)
+
+    @app.route('/data/lists', methods=['GET'])
+    @dashboard('users')
+    async def get_lists():
+        query, params = lists_query(request.args.get('group', ''))
+        async with pool.cursor(dictionary=True) as (conn, cursor):
+            await cursor.execute(query, params)
+            lists = await cursor.fetchall()
+        return json_response(lists)
+
+    @app.route('/data/dashboard', methods=['GET'])
+    @dashboard('users', 'objects')
+    async def get_dashboard_data():
+        group = request.args.get('group', '')
+        query, params = user_totals_query([POINTS_COLUMN, TIME_COLUMN], group, request.args.getlist('lists'))
+        async with pool.cursor(dictionary=True) as (conn, cursor):
+            await cursor.execute(query, params)
+            users = await cursor.fetchall()
+            await cursor.execute(FACETS_QUERY)
+            groups, lists = dashboard_facets(await cursor.fetchall(), group)
+        return json_response({'users': users, 'groups': groups, 'lists': lists})
+
+    @app.route('/data/group-comparison', methods=['GET'])
+    @dashboard('users', 'objects')
+    async def get_group_comparison_data():
+        groups = request.args.getlist('groups') or list(app.config['GROUP_COMPARISON_DEFAULT_GROUPS'])
+        where, params = group_comparison_where(groups, request.args.getlist('lists'))
+
+        # The summary and streaming modes reuse the synchronous helpers on the
+        # Flask app's pool, off the event loop.
+        if request.args.get('summary', '').lower() in ('1', 'true'):
+            bins = request.args.get('bins', 10, type=int)
+            if not 1 <= bins <= 100:
+                return await make_response(jsonify({'success': False, 'message': 'bins must be between 1 and 100'}), 400)
+
+            def summarize():
+                with reads.cursor() as (conn, cursor):
+                    return group_score_summary(cursor, where, params, bins)
+            return json_response(await in_thread(summarize))
+
+        query = group_scores_query(where)
+
+        if request.args.get('stream', '').lower() in ('1', 'true'):
+            chunks = stream_group_scores(reads, query + " ORDER BY u.group", params,
+                                         app.config['GROUP_COMPARISON_STREAM_CHUNK'])
+
+            # A disconnect cancels body() while next() may still be running
+            # in its thread; the lock makes close() wait for it instead of
+            # failing with "generator already executing".
+            step_lock = threading.Lock()
+
+            def step():
+                with step_lock:
+                    return next(chunks, None)
+
+            def close():
+                with step_lock:
+                    chunks.close()
+
+            async def body():
+                try:
+                    while True:
+                        chunk = await in_thread(step)
+                        if chunk is None:
+                            break
+                        yield chunk.encode()
+                finally:
+                    await in_thread(close)
+            return body(), 200, {'Content-Type': 'application/json'}
+
+        async with pool.cursor(dictionary=True) as (conn, cursor):
+            await cursor.execute(query, params)
+            results = await cursor.fetchall()
+        return json_response(group_scores(results))
+
+    @app.route('/stats/async', methods=['GET'])
+    async def get_async_stats():
+        return jsonify({
+            'pool': pool.stats(),
+            'single_flight': single_flight.stats(),
+            'admission': concurrency.stats(),
+            'pid': os.getpid(),
+        }), 200
+
+    return Dispatcher(app, flask_app)
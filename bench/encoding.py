@@ -0,0 +1,91 @@
+"""JSON encoding and compression micro-benchmark.
+
+Encodes synthetic payloads shaped like the largest /data/* responses with
+every available JSON backend and compresses them with every available
+encoding, reporting encode time and wire bytes:
+
+    python -m bench.encoding --users 5000 --scores 100000 --output bench/encoding.json
+
+No database is needed; use bench.run with --compress to measure the same
+effect end to end.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import encoding
+from bench.seed import GROUPS, LISTS, bench_initials
+
+
+def make_payloads(users, scores, seed_value):
+    rng = random.Random(seed_value)
+    points = [{
+        'usuario_nombre': bench_initials(i),
+        'grupo_nombre': rng.choice(GROUPS),
+        'list': rng.choice(LISTS),
+        'role': 'student',
+        # Totals come from user_object_totals: total_score is a DOUBLE
+        # (float) and total_tries * 60 a BIGINT (int).
+        'total_puntuacion': round(rng.uniform(0, 100000), 2),
+    } for i in range(users)]
+    dashboard = {
+        'users': [dict(row, total_tiempo=rng.randint(0, 100) * 60) for row in points],
+        'groups': [{'group_name': group} for group in GROUPS],
+        'lists': [{'list': name} for name in LISTS],
+    }
+    comparison = [{'group': group, 'scores': [rng.randint(0, 100) for _ in range(scores // len(GROUPS))]}
+                  for group in GROUPS]
+    return {'/data/points': points, '/data/dashboard': dashboard, '/data/group-comparison': comparison}
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark JSON encoders and response compression.')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--scores', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5, help='Best of N timings')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    backends = ['stdlib'] + (['orjson'] if encoding.orjson is not None else [])
+    encodings = ['gzip'] + (['br'] if encoding.brotli is not None else [])
+    results = {}
+    for route, payload in make_payloads(args.users, args.scores, args.seed).items():
+        entry = results[route] = {'encode': {}, 'compress': {}}
+        body = None
+        for backend in backends:
+            codec = encoding.JSONCodec(backend=backend)
+            body, seconds = timed(lambda: codec.dumps(payload), args.repeat)
+            entry['encode'][backend] = {'ms': round(1000 * seconds, 3), 'bytes': len(body)}
+        for name in encodings:
+            compressed, seconds = timed(lambda: encoding.compress(body, name), args.repeat)
+            entry['compress'][name] = {'ms': round(1000 * seconds, 3), 'bytes': len(compressed),
+                                       'saved': round(1 - len(compressed) / len(body), 4)}
+
+        print(route)
+        for backend, stats in entry['encode'].items():
+            print("  encode %-8s %9.3f ms  %9d bytes" % (backend, stats['ms'], stats['bytes']))
+        for name, stats in entry['compress'].items():
+            print("  %-15s %9.3f ms  %9d bytes  (%.1f%% saved)"
+                  % (name, stats['ms'], stats['bytes'], 100 * stats['saved']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'users': args.users, 'scores': args.scores, 'routes': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""Query-plan regression check.
+
+Drives every endpoint of create_app() through the Flask test client
+against a seeded benchmark database, captures each SELECT/UPDATE/DELETE
+the app sends to MySQL, runs EXPLAIN on it and exits non-zero if a
+statement falls back to a full table or full index scan:
+
+    python -m bench.explain --db-host 127.0.0.1 --db-name gamedb_bench --users 500 --objects 20000
+
+The statements in UNFILTERED (whole-table dashboards, facets, the
+leaderboard loader) are expected to read every row and are reported but
+not failed, as are scans of the tiny lookup tables in SMALL_TABLES.
+"""
+import argparse
+import json
+import os
+import sys
+
+from db import InstrumentedConnection, InstrumentedCursor
+from bench.run import PRODUCTION_HOSTS
+from bench.seed import BENCH_PASSWORD, bench_initials, seed
+from queries import (POINTS_COLUMN, TIME_COLUMN, GROUPS_QUERY, FACETS_QUERY, LEADERBOARD_QUERY,
+                     user_totals_query, lists_query)
+
+SMALL_TABLES = {'levels', 'data_versions', 'schema_migrations'}
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+# 'ALL' is a full table scan, 'index' a full scan of an index.
+SCAN_TYPES = ('ALL', 'index')
+
+
+def normalize(operation):
+    return ' '.join(operation.split())
+
+
+# Statements that read whole tables by design, keyed like `captured`.
+UNFILTERED = {normalize(operation) for operation in (
+    user_totals_query([POINTS_COLUMN])[0],
+    user_totals_query([TIME_COLUMN])[0],
+    user_totals_query([POINTS_COLUMN, TIME_COLUMN])[0],
+    GROUPS_QUERY,
+    lists_query()[0],
+    FACETS_QUERY,
+    LEADERBOARD_QUERY,
+)}
+
+
+class CapturingCursor(InstrumentedCursor):
+    def __init__(self, cursor, captured):
+        super().__init__(cursor, lambda statement, seconds, rows: None)
+        self._captured = captured
+
+    def execute(self, operation, params=(), *args, **kwargs):
+        # Keyed on collapsed whitespace; the original text is kept because it
+        # may contain '--' comments that need their line breaks.
+        self._captured.setdefault(normalize(operation), (operation, tuple(params or ())))
+        return super().execute(operation, params, *args, **kwargs)
+
+
+class CapturingConnection(InstrumentedConnection):
+    def __init__(self, conn, captured):
+        super().__init__(conn, None)
+        self._captured = captured
+
+    def wrap_cursor(self, cursor):
+        return CapturingCursor(cursor, self._captured)
+
+
+def exercise(client, initials, level_ids):
+    user = initials[0]
+    json_body = {'content_type': 'application/json'}
+    requests = [
+        ('GET', '/data/points', None),
+        ('GET', '/data/points?group=A', None),
+        ('GET', '/data/points?lists=list1&lists=list2', None),
+        ('GET', '/data/points?group=B&lists=list1', None),
+        ('GET', '/data/time', None),
+        ('GET', '/data/time?group=A', None),
+        ('GET', '/data/time?lists=list1', None),
+        ('GET', '/data/groups', None),
+        ('GET', '/data/lists', None),
+        ('GET', '/data/lists?group=A', None),
+        ('GET', '/data/dashboard', None),
+        ('GET', '/data/dashboard?group=A&lists=list1', None),
+        ('GET', '/data/leaderboard?limit=10', None),
+        ('GET', '/data/leaderboard/rank/' + user, None),
+        ('GET', '/data/group-comparison', None),
+        ('GET', '/data/group-comparison?groups=A&lists=list1', None),
+        ('GET', '/data/group-comparison?summary=true', None),
+        ('GET', '/data/group-comparison?stream=true&groups=B', None),
+        ('POST', '/login', {'initials': user, 'password': BENCH_PASSWORD}),
+        ('PUT', '/user_levels/' + user, {'level_id': level_ids[0], 'score': 50, 'tries': 2, 'completed': True}),
+        ('POST', '/user_levels', {'updates': [
+            {'user_initials': u, 'level_id': level_ids[-1], 'score': 70, 'tries': 3} for u in initials[:5]
+        ]}),
+        ('POST', '/register', {'initials': 'explain_check', 'password': 'x', 'gender': 'female', 'group': 'A'}),
+        ('POST', '/register/bulk', [{'initials': 'explain_bulk', 'password': 'x', 'gender': 'male'}]),
+    ]
+    failed = []
+    for method, path, body in requests:
+        kwargs = dict(json_body, data=json.dumps(body)) if body is not None else {}
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()
+        if response.status_code >= 500:
+            print("%s %s failed with %d" % (method, path, response.status_code))
+            failed.append(path)
+    return failed
+
+
+def explain(pool, captured):
+    failures = []
+    with pool.cursor(dictionary=True) as (conn, cursor):
+        for statement, (operation, params) in sorted(captured.items()):
+            if not statement.upper().startswith(EXPLAINABLE):
+                continue
+            cursor.execute("EXPLAIN " + operation, params)
+            plan = cursor.fetchall()
+            scans = [row for row in plan if row['type'] in SCAN_TYPES and row['table'] not in SMALL_TABLES]
+            verdict = 'ok'
+            if scans and statement in UNFILTERED:
+                verdict = 'full read (unfiltered)'
+            elif scans:
+                verdict = 'FULL SCAN'
+                failures.append(statement)
+            print("[%s] %s" % (verdict, statement[:150]))
+            for row in plan:
+                print("    table=%-20s type=%-8s key=%-28s rows=%-8s extra=%s"
+                      % (row['table'], row['type'], row['key'], row['rows'], row['Extra']))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fail when an app query regresses to a full table scan.')
+    parser.add_argument('--db-host', default=os.environ.get('DB_HOST', '127.0.0.1'))
+    parser.add_argument('--db-port', type=int, default=int(os.environ.get('DB_PORT', 3306)))
+    parser.add_argument('--db-user', default=os.environ.get('DB_USER', 'root'))
+    parser.add_argument('--db-password', default=os.environ.get('DB_PASSWORD', ''))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'gamedb_bench'))
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--objects', type=int, default=20000)
+    parser.add_argument('--levels', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.db_host in PRODUCTION_HOSTS:
+        parser.error('Refusing to seed the production database')
+
+    from app import create_app
+    app = create_app({
+        'DB_HOST': args.db_host,
+        'DB_PORT': args.db_port,
+        'DB_USER': args.db_user,
+        'DB_PASSWORD': args.db_password,
+        'DB_NAME': args.db_name,
+        'RESPONSE_CACHE_ENABLED': False,
+        'PASSWORD_HASH_WORKERS': 0,
+    })
+    pool = app.extensions['db_pool']
+    initials, level_ids = seed(pool, args.users, args.objects, args.levels)
+
+    # Statements are recorded at the pool boundary, so everything a request
+    # sends to MySQL is seen, including helper modules.
+    captured = {}
+    acquire = pool.acquire
+    pool.acquire = lambda: CapturingConnection(acquire(), captured)
+    errors = exercise(app.test_client(), initials or [bench_initials(0)], level_ids)
+    pool.acquire = acquire
+
+    failures = explain(pool, captured)
+    if failures:
+        print("%d statement(s) use a full table scan" % len(failures))
+    if errors:
+        # Statements after the failure point were never captured.
+        print("%d request(s) failed; their statements were not all checked" % len(errors))
+    if failures or errors:
+        return 1
+    print("No full table scans in %d captured statements" % len(captured))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
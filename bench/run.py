@@ -0,0 +1,287 @@
+"""Load-test harness for the game API.
+
+Starts the app from create_app() in-process (or targets --url), seeds a
+synthetic dataset into a local benchmark database, runs scripted request
+mixes and writes per-route throughput and latency percentiles as JSON:
+
+    python -m bench.run --db-host 127.0.0.1 --db-name gamedb_bench \\
+        --users 500 --objects 20000 --scenario all --output bench/results.json
+
+    python -m bench.run ... --baseline bench/results.json --max-regression 0.2
+
+    python -m bench.run ... --mode async --baseline bench/results.json   # ASGI vs WSGI
+
+See also bench.encoding for JSON encoder and compression timings.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.seed import BENCH_PASSWORD, GROUPS, LISTS, bench_initials, seed
+
+SCENARIOS = ('login_storm', 'score_burst', 'dashboard_poll')
+PRODUCTION_HOSTS = ('database-1.cpm0ooec0kjr.us-east-1.rds.amazonaws.com',)
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = max(int(round(percent / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, route, elapsed, ok, size):
+        with self._lock:
+            entry = self.samples.setdefault(route, {'latencies': [], 'errors': 0, 'bytes': 0})
+            entry['latencies'].append(elapsed)
+            entry['bytes'] += size
+            if not ok:
+                entry['errors'] += 1
+
+    def summary(self, duration):
+        routes = {}
+        for route, entry in sorted(self.samples.items()):
+            latencies = sorted(entry['latencies'])
+            routes[route] = {
+                'count': len(latencies),
+                'errors': entry['errors'],
+                'throughput': round(len(latencies) / duration, 2),
+                'bytes': entry['bytes'],
+                'mean_ms': round(1000 * sum(latencies) / len(latencies), 3),
+                'p50_ms': round(1000 * percentile(latencies, 50), 3),
+                'p95_ms': round(1000 * percentile(latencies, 95), 3),
+                'p99_ms': round(1000 * percentile(latencies, 99), 3),
+            }
+        return routes
+
+
+def request(base_url, method, path, body=None, headers=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers=dict(headers or {}))
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def make_scenarios(initials, level_ids):
+    # Each scenario returns (route label, method, path, body) for one request.
+    def login_storm(rng):
+        user = rng.choice(initials)
+        return '/login', 'POST', '/login', {'initials': user, 'password': BENCH_PASSWORD}
+
+    def score_burst(rng):
+        user = rng.choice(initials)
+        if rng.random() < 0.1:
+            updates = [{'user_initials': user, 'level_id': rng.choice(level_ids),
+                        'score': rng.randint(0, 100), 'tries': rng.randint(1, 10), 'completed': True}
+                       for _ in range(20)]
+            return '/user_levels (batch)', 'POST', '/user_levels', {'updates': updates}
+        body = {'level_id': rng.choice(level_ids), 'score': rng.randint(0, 100),
+                'tries': rng.randint(1, 10), 'completed': rng.random() < 0.5}
+        return '/user_levels/<user_initials>', 'PUT', '/user_levels/' + user, body
+
+    dashboard_paths = [
+        ('/data/points', lambda rng: '/data/points?group=' + rng.choice(GROUPS)),
+        ('/data/time', lambda rng: '/data/time?lists=' + rng.choice(LISTS)),
+        ('/data/groups', lambda rng: '/data/groups'),
+        ('/data/lists', lambda rng: '/data/lists?group=' + rng.choice(GROUPS)),
+        ('/data/dashboard', lambda rng: '/data/dashboard?group=' + rng.choice(GROUPS)),
+        ('/data/leaderboard', lambda rng: '/data/leaderboard?limit=10'),
+        ('/data/leaderboard/rank/<user_initials>', lambda rng: '/data/leaderboard/rank/' + rng.choice(initials)),
+        ('/data/group-comparison', lambda rng: '/data/group-comparison'),
+        ('/data/group-comparison?summary', lambda rng: '/data/group-comparison?summary=true'),
+    ]
+
+    def dashboard_poll(rng):
+        label, path = rng.choice(dashboard_paths)
+        return label, 'GET', path(rng), None
+
+    return {'login_storm': login_storm, 'score_burst': score_burst, 'dashboard_poll': dashboard_poll}
+
+
+def run_scenario(base_url, scenario, requests_total, concurrency, seed_value, recorder, headers=None):
+    counter = iter(range(requests_total))
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        rng = random.Random(seed_value * 1000 + worker_id)
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            label, method, path, body = scenario(rng)
+            started = time.perf_counter()
+            try:
+                status, payload = request(base_url, method, path, body, headers)
+                ok = status < 400
+            except OSError:
+                status, payload, ok = 0, b'', False
+            recorder.add(label, time.perf_counter() - started, ok, len(payload))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return time.perf_counter() - started
+
+
+def start_server(app_config, port, mode='sync'):
+    # Returns the Flask app, whose pool is used for seeding in both modes.
+    if mode == 'async':
+        import uvicorn
+        from asgi import create_async_app
+        dispatcher = create_async_app(app_config)
+        server = uvicorn.Server(uvicorn.Config(dispatcher, host='127.0.0.1', port=port,
+                                               log_level='warning', lifespan='on'))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+        return dispatcher.flask_app
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    app = create_app(app_config)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return app
+
+
+def compare(results, baseline, max_regression):
+    regressions = []
+    for scenario, routes in results['scenarios'].items():
+        for route, stats in routes.items():
+            before = baseline.get('scenarios', {}).get(scenario, {}).get(route)
+            if not before:
+                continue
+            change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+            print("%-15s %-42s p95 %9.3f ms -> %9.3f ms (%+.1f%%)"
+                  % (scenario, route, before['p95_ms'], stats['p95_ms'], 100 * change))
+            if change > max_regression:
+                regressions.append((scenario, route, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the game API.')
+    parser.add_argument('--db-host', default=os.environ.get('DB_HOST', '127.0.0.1'))
+    parser.add_argument('--db-port', type=int, default=int(os.environ.get('DB_PORT', 3306)))
+    parser.add_argument('--db-user', default=os.environ.get('DB_USER', 'root'))
+    parser.add_argument('--db-password', default=os.environ.get('DB_PASSWORD', ''))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'gamedb_bench'))
+    parser.add_argument('--db-replica-host', default=os.environ.get('DB_REPLICA_HOST'),
+                        help='Serve /data/* reads from this replica of --db-host')
+    parser.add_argument('--db-replica-port', type=int, default=int(os.environ.get('DB_REPLICA_PORT', 0)) or None)
+    parser.add_argument('--url', help='Benchmark an already running server instead of starting one')
+    parser.add_argument('--port', type=int, default=14466)
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync',
+                        help='Serve app.create_app() threaded (sync) or asgi.create_async_app() under uvicorn (async)')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--objects', type=int, default=20000)
+    parser.add_argument('--levels', type=int, default=3)
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database')
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='Turn per-client rate limits on; all bench traffic comes from one address')
+    parser.add_argument('--compress', action='store_true',
+                        help='Send Accept-Encoding: br, gzip; route bytes are then the compressed sizes')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare p95 latencies with a previous results file')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Fail when a route p95 grows by more than this fraction versus --baseline')
+    args = parser.parse_args(argv)
+
+    if args.db_host in PRODUCTION_HOSTS or args.db_replica_host in PRODUCTION_HOSTS:
+        parser.error('Refusing to seed and load-test the production database')
+    if args.mode == 'async' and args.db_replica_host:
+        # The async /data/* routes read from the primary's aiomysql pool, so
+        # the results would not be comparable with a sync run.
+        parser.error('--db-replica-host is not supported with --mode async')
+
+    app_config = {
+        'DB_HOST': args.db_host,
+        'DB_PORT': args.db_port,
+        'DB_USER': args.db_user,
+        'DB_PASSWORD': args.db_password,
+        'DB_NAME': args.db_name,
+        'DB_REPLICA_HOST': args.db_replica_host,
+        'DB_REPLICA_PORT': args.db_replica_port,
+        'RATE_LIMIT_ENABLED': args.rate_limit,
+    }
+
+    base_url = args.url
+    app = None
+    if not base_url:
+        app = start_server(app_config, args.port, args.mode)
+        base_url = 'http://127.0.0.1:%d' % args.port
+
+    if args.no_seed:
+        initials = [bench_initials(i) for i in range(args.users)]
+        level_ids = list(range(1, args.levels + 1))
+    elif app is not None:
+        initials, level_ids = seed(app.extensions['db_pool'], args.users, args.objects, args.levels, args.seed)
+    else:
+        parser.error('--url requires --no-seed (seed the target database separately)')
+
+    scenarios = make_scenarios(initials, level_ids)
+    names = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+    results = {
+        'meta': {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'users': args.users,
+            'objects': args.objects,
+            'levels': args.levels,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+            'replica': bool(args.db_replica_host),
+            'mode': args.mode if not args.url else 'external',
+            'compress': args.compress,
+            'rate_limit': args.rate_limit,
+        },
+        'scenarios': {},
+    }
+    for name in names:
+        recorder = Recorder()
+        duration = run_scenario(base_url, scenarios[name], args.requests, args.concurrency, args.seed, recorder,
+                                {'Accept-Encoding': 'br, gzip'} if args.compress else None)
+        results['scenarios'][name] = recorder.summary(duration)
+        print("%s: %d requests in %.2fs" % (name, args.requests, duration))
+        for route, stats in results['scenarios'][name].items():
+            print("  %-42s %7.1f req/s  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  errors %d"
+                  % (route, stats['throughput'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['errors']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print("%d route(s) regressed by more than %d%%" % (len(regressions), 100 * args.max_regression))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
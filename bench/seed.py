@@ -0,0 +1,61 @@
+import random
+
+from werkzeug.security import generate_password_hash
+
+from aggregates import rebuild_user_totals, rebuild_statistics
+from schema import migrate
+
+BENCH_PASSWORD = 'benchpass'
+GROUPS = ('A', 'B', 'C', 'D')
+LISTS = ('list1', 'list2', 'list3')
+
+
+def bench_initials(i):
+    return 'bench%06d' % i
+
+
+def seed(pool, users=500, objects=20000, levels=3, seed_value=42, log=print):
+    # Replaces the contents of the (benchmark) database with a synthetic
+    # dataset. Every user shares one password hash so seeding stays fast.
+    rng = random.Random(seed_value)
+    pwhash = generate_password_hash(BENCH_PASSWORD)
+    with pool.connection() as conn:
+        # The benchmark database gets the deploy-time migrations too.
+        migrate(conn, log=lambda message: None, deploy=True)
+        cursor = conn.cursor()
+        try:
+            for table in ('user_object_totals', 'user_levels', 'objects', 'leaderboard', 'statistics', 'users', 'levels'):
+                cursor.execute("DELETE FROM %s" % table)
+            cursor.executemany(
+                "INSERT INTO levels (name, max_score) VALUES (%s, %s)",
+                [('Level %d' % (i + 1), 100 * (i + 1)) for i in range(levels)]
+            )
+            cursor.execute("SELECT id FROM levels")
+            level_ids = [row[0] for row in cursor.fetchall()]
+
+            initials = [bench_initials(i) for i in range(users)]
+            cursor.executemany(
+                "INSERT INTO users (initials, password, role, list, `group`, gender) VALUES (%s, %s, %s, %s, %s, %s)",
+                [(u, pwhash, 'student', rng.choice(LISTS), rng.choice(GROUPS), rng.choice(('male', 'female')))
+                 for u in initials]
+            )
+            cursor.executemany(
+                "INSERT INTO user_levels (user_initials, level_id, completed, score, tries) VALUES (%s, %s, %s, %s, %s)",
+                [(u, level_id, rng.random() < 0.5, rng.randint(0, 100), rng.randint(0, 10))
+                 for u in initials for level_id in level_ids]
+            )
+            batch = []
+            for _ in range(objects):
+                batch.append((rng.uniform(0, 100), rng.randint(1, 10), rng.choice(initials)))
+                if len(batch) == 5000:
+                    cursor.executemany("INSERT INTO objects (score, tries, user_initials) VALUES (%s, %s, %s)", batch)
+                    batch = []
+            if batch:
+                cursor.executemany("INSERT INTO objects (score, tries, user_initials) VALUES (%s, %s, %s)", batch)
+            conn.commit()
+        finally:
+            cursor.close()
+        rebuild_user_totals(conn, log=lambda message: None)
+        rebuild_statistics(conn, log=lambda message: None)
+    log("Seeded %d users, %d objects, %d levels" % (users, objects, levels))
+    return initials, level_ids
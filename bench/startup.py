@@ -0,0 +1,105 @@
+"""Worker startup-time and memory measurement.
+
+Imports app.py and runs create_app() in fresh interpreters, the way a
+gunicorn worker boots, and reports wall time and peak RSS for each
+API_DOCS mode. With 'lazy' it also times the first /apispec_1.json hit,
+which is when the docs are built:
+
+    python -m bench.startup --runs 5 --output bench/startup.json
+    python -m bench.startup --baseline bench/startup.json --max-regression 0.2
+
+No database is needed: migrations are skipped and the pool connects lazily.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODES = ('lazy', 'off')
+
+PROBE = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({'SCHEMA_MIGRATE_ON_START': False, 'API_DOCS': sys.argv[1]})
+created = time.perf_counter()
+result = {
+    'import_ms': 1000 * (imported - started),
+    'create_app_ms': 1000 * (created - imported),
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'flasgger_loaded': 'flasgger' in sys.modules,
+}
+if sys.argv[1] != 'off':
+    first = time.perf_counter()
+    status = app.test_client().get('/apispec_1.json').status_code
+    result['first_docs_ms'] = 1000 * (time.perf_counter() - first)
+    result['first_docs_status'] = status
+    result['rss_after_docs_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(result))
+"""
+
+
+def measure(mode, runs):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, METRICS_ENABLED=os.environ.get('METRICS_ENABLED', '0'))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE, mode], cwd=root, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    summary = {}
+    for key in samples[0]:
+        values = sorted(sample[key] for sample in samples)
+        # Median for timings and memory; flags and statuses are constant.
+        summary[key] = values[len(values) // 2]
+        if isinstance(summary[key], float):
+            summary[key] = round(summary[key], 3)
+    summary['startup_ms'] = round(summary['import_ms'] + summary['create_app_ms'], 3)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure worker startup time and memory.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', choices=MODES + ('all',), default='all')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare startup times with a previous results file')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for mode in (MODES if args.mode == 'all' else (args.mode,)):
+        results[mode] = measure(mode, args.runs)
+        stats = results[mode]
+        print("API_DOCS=%-5s startup %8.1f ms (import %.1f, create_app %.1f)  rss %6d kB  flasgger loaded: %s"
+              % (mode, stats['startup_ms'], stats['import_ms'], stats['create_app_ms'], stats['rss_kb'],
+                 stats['flasgger_loaded']))
+        if 'first_docs_ms' in stats:
+            print("               first /apispec_1.json %8.1f ms (status %d)  rss %6d kB"
+                  % (stats['first_docs_ms'], stats['first_docs_status'], stats['rss_after_docs_kb']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = 0
+        for mode, stats in results.items():
+            before = baseline.get(mode)
+            if not before:
+                continue
+            change = (stats['startup_ms'] - before['startup_ms']) / before['startup_ms']
+            print("API_DOCS=%-5s startup %8.1f ms -> %8.1f ms (%+.1f%%)"
+                  % (mode, before['startup_ms'], stats['startup_ms'], 100 * change))
+            regressions += change > args.max_regression
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, make_response
+
+
+def request_key(req=None):
+    # Route plus normalized query string: argument order does not matter.
+    # `req` defaults to Flask's request (asgi.py passes Quart's).
+    req = request if req is None else req
+    args = tuple(sorted(req.args.items(multi=True)))
+    return (req.path, args)
+
+
+def shareable_headers(response):
+    # Headers that can be replayed to other clients. CORS headers are per
+    # request and are added again by flask_cors.
+    return [(name, value) for name, value in response.headers.items()
+            if name not in ('Content-Length', 'Set-Cookie', 'Vary')
+            and not name.startswith('Access-Control-')]
+
+
+class ResponseCache:
+    # Per-process LRU cache for GET responses with a TTL. Entries are tagged
+    # with the tables they were computed from and dropped as soon as a write
+    # to one of those tables is reported through invalidate(). When a
+    # `version_fn` is given, entries also remember the shared data version of
+    # their tags and are ignored once it moves, which picks up writes made by
+    # other gunicorn workers; otherwise those are only seen after the TTL.
+    # Requests for which `bypass()` is true are neither served from nor
+    # stored in the cache.
+    def __init__(self, max_entries=512, ttl=30, enabled=True, version_fn=None, bypass=None):
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self.bypass = bypass
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def make_key():
+        return request_key()
+
+    @property
+    def generation(self):
+        # Pass to set() to drop results computed across an invalidation.
+        return self._generation
+
+    def get(self, key, token=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry['token'] != token:
+                del self._entries[key]
+                self._invalidations += 1
+                self._misses += 1
+                return None
+            if entry['expires'] <= time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def set(self, key, tags, body, status, headers, generation=None, token=None):
+        with self._lock:
+            # Skip results computed while an invalidation happened.
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = {
+                'tags': frozenset(tags),
+                'token': token,
+                'body': body,
+                'status': status,
+                'headers': headers,
+                'expires': time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, entry in self._entries.items() if entry['tags'] & tags]
+            for key in stale:
+                del self._entries[key]
+            self._invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, *tags):
+        # Caches successful responses of a view keyed on path plus the
+        # normalized query string.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or (self.bypass is not None and self.bypass()):
+                    return view(*args, **kwargs)
+                key = self.make_key()
+                token = self.version_fn(tags) if self.version_fn else None
+                entry = self.get(key, token)
+                if entry is not None:
+                    return make_response(entry['body'], entry['status'], entry['headers'])
+                generation = self.generation
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    self.set(key, tags, response.get_data(), response.status_code,
+                             shareable_headers(response), generation, token)
+                return response
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+            }
@@ -0,0 +1,349 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector.cursor import MySQLCursorPrepared
+
+try:
+    from mysql.connector.connection_cext import CMySQLConnection
+    from mysql.connector.cursor_cext import CMySQLCursorPrepared
+except ImportError:  # C extension not built
+    CMySQLConnection = None
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+_VALUE_TUPLE = r"\(\s*(?:%s|\d+)(?:\s*,\s*(?:%s|\d+))*\s*\)"
+_PLACEHOLDER_LIST = re.compile(_VALUE_TUPLE + r"(?:\s*,\s*" + _VALUE_TUPLE + r")*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_label(operation):
+    # Normalizes SQL text into a low-cardinality label: whitespace collapsed,
+    # variable-length placeholder lists folded to (?).
+    label = _PLACEHOLDER_LIST.sub('(?)', operation)
+    label = _WHITESPACE.sub(' ', label).strip()
+    return label[:160]
+
+
+class InstrumentedCursor:
+    # Thin proxy around a MySQL cursor that reports the execution time of
+    # every statement and the number of rows it returned or changed.
+    def __init__(self, cursor, on_query):
+        self._cursor = cursor
+        self._on_query = on_query
+        self._label = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, fn, operation, *args, **kwargs):
+        self._label = statement_label(operation)
+        started = time.perf_counter()
+        try:
+            return fn(operation, *args, **kwargs)
+        finally:
+            # Rows of a result set are counted as they are fetched.
+            rows = 0 if self._cursor.with_rows else max(self._cursor.rowcount or 0, 0)
+            self._on_query(self._label, time.perf_counter() - started, rows)
+
+    def execute(self, operation, params=(), *args, **kwargs):
+        return self._timed(self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        return self._timed(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def _fetched(self, rows):
+        if rows:
+            self._on_query(self._label, None, len(rows))
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._on_query(self._label, None, 1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._fetched(self._cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._fetched(self._cursor.fetchall())
+
+
+class InstrumentedConnection:
+    def __init__(self, conn, on_query):
+        self._conn = conn
+        self._on_query = on_query
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return self.wrap_cursor(self._conn.cursor(*args, **kwargs))
+
+    def wrap_cursor(self, cursor):
+        # Also applied to the pool's prepared cursors (see prepared_cursor).
+        return InstrumentedCursor(cursor, self._on_query)
+
+
+def _unwrap(conn):
+    while isinstance(conn, InstrumentedConnection):
+        conn = conn._conn
+    return conn
+
+
+class ConnectionPool:
+    # A small thread-safe pool of MySQL connections. `size` connections are
+    # kept open between requests; up to `max_overflow` extra connections may
+    # be opened under bursts and are closed again as soon as they are returned.
+    # `on_acquire(seconds)` and `on_query(statement, seconds, rows)` are
+    # optional instrumentation hooks; on_query gets seconds=None when it only
+    # reports rows fetched from an earlier statement. Each connection keeps
+    # up to `prepared_cache_size` server-side prepared statements for
+    # prepared_cursor(), least recently used first out.
+    def __init__(self, db_config, size=5, max_overflow=10, timeout=30, recycle=3600,
+                 on_acquire=None, on_query=None, prepared_cache_size=16):
+        self.db_config = db_config
+        self.prepared_cache_size = max(prepared_cache_size, 1)
+        self.on_acquire = on_acquire
+        self.on_query = on_query
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._pid = os.getpid()
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._prepared_hits = 0
+        self._prepared_misses = 0
+        self._prepared_evictions = 0
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.db_config)
+        conn._pool_created_at = time.monotonic()
+        conn._pool_statements = OrderedDict()
+        return conn
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reset_after_fork(self):
+        # Connections opened in the gunicorn master must not be shared with
+        # the forked workers, so each process starts with an empty pool.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._open = 0
+            self._in_use = 0
+            self._waiting = 0
+
+    def _is_healthy(self, conn):
+        if self.recycle and time.monotonic() - conn._pool_created_at > self.recycle:
+            return False
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._lock:
+            self._reset_after_fork()
+            self._waiting += 1
+            try:
+                while not self._idle and self._open >= self.size + self.max_overflow:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout('Timed out waiting for a database connection')
+                    self._lock.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._open += 1
+            self._in_use += 1
+
+            waited = time.monotonic() - started
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        try:
+            if conn is not None and not self._is_healthy(conn):
+                self._close_quietly(conn)
+                with self._lock:
+                    self._discarded += 1
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        if self.on_acquire is not None:
+            self.on_acquire(time.monotonic() - started)
+        if self.on_query is not None:
+            return InstrumentedConnection(conn, self.on_query)
+        return conn
+
+    def invalidate(self, conn):
+        # For a connection abandoned in the middle of a result set (a stream
+        # whose client went away): closing it is cheaper than reading the
+        # remaining rows, and release() then discards it.
+        conn = _unwrap(conn)
+        conn._pool_invalid = True
+        self._close_quietly(conn)
+
+    def release(self, conn):
+        conn = _unwrap(conn)
+        try:
+            if getattr(conn, '_pool_invalid', False):
+                keep = False
+            else:
+                # Never hand out a connection with a half-finished transaction.
+                if conn.in_transaction:
+                    conn.rollback()
+                keep = True
+        except Exception:
+            keep = False
+
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            if not keep:
+                self._discarded += 1
+            if keep and len(self._idle) < self.size:
+                self._idle.append(conn)
+                conn = None
+            else:
+                self._open -= 1
+            self._lock.notify()
+
+        if conn is not None:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        with self.connection() as conn:
+            cursor = conn.cursor(**kwargs)
+            try:
+                yield conn, cursor
+            finally:
+                cursor.close()
+
+    def prepared_cursor(self, conn, operation):
+        # Returns a cursor of `conn` (checked out from this pool) on which
+        # `operation` is prepared server-side. The cursor belongs to the
+        # connection and is reused by later checkouts, so callers must not
+        # close it and must fetch all rows before running other statements.
+        # Statements whose text changes are new entries; the old ones age out.
+        # The driver's prepared cursors only skip re-preparing for the very
+        # string they last ran, so pass the same constant (see queries.py).
+        raw = _unwrap(conn)
+        statements = raw._pool_statements
+        cursor = statements.get(operation)
+        with self._lock:
+            if cursor is not None:
+                self._prepared_hits += 1
+            else:
+                self._prepared_misses += 1
+        if cursor is not None:
+            statements.move_to_end(operation)
+        else:
+            cursor_class = CMySQLCursorPrepared if (
+                CMySQLConnection is not None and isinstance(raw, CMySQLConnection)) else MySQLCursorPrepared
+            cursor = statements[operation] = raw.cursor(cursor_class=cursor_class)
+            while len(statements) > self.prepared_cache_size:
+                _, evicted = statements.popitem(last=False)
+                self.discard_prepared(evicted)
+        if isinstance(conn, InstrumentedConnection):
+            return conn.wrap_cursor(cursor)
+        return cursor
+
+    def discard_prepared(self, cursor):
+        # Closing the cursor deallocates its statement on the server.
+        with self._lock:
+            self._prepared_evictions += 1
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def prepared(self, operation):
+        # Like cursor(), for one statement that runs often enough to keep
+        # prepared. A statement that fails is dropped and prepared again next
+        # time.
+        with self.connection() as conn:
+            try:
+                yield conn, self.prepared_cursor(conn, operation)
+            except Exception:
+                cursor = _unwrap(conn)._pool_statements.pop(operation, None)
+                if cursor is not None:
+                    self.discard_prepared(cursor)
+                raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_max': round(self._wait_max, 6),
+                'wait_time_avg': round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+                'prepared_hits': self._prepared_hits,
+                'prepared_misses': self._prepared_misses,
+                'prepared_evictions': self._prepared_evictions,
+            }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for conn in idle:
+            self._close_quietly(conn)
@@ -0,0 +1,76 @@
+import os
+import threading
+
+import click
+from flask import Flask, send_file
+
+DOCS_PREFIXES = ('/apidocs', '/apispec', '/flasgger_static')
+SPEC_ROUTE = '/apispec_1.json'
+
+
+def swag_from(specs):
+    # Stand-in for flasgger.swag_from(dict): stores the spec on the view the
+    # same way, without importing Flasgger in every worker.
+    def decorator(view):
+        view.specs_dict = specs
+        return view
+    return decorator
+
+
+def build_docs_app(app):
+    # A docs-only Flask app with the same rules and view functions as `app`
+    # (Flasgger only introspects them) plus the Flasgger UI and spec routes.
+    from flasgger import Swagger
+
+    docs = Flask(app.import_name, static_folder=None)
+    docs.config.update(app.config)
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint not in docs.view_functions:
+            docs.add_url_rule(rule.rule, rule.endpoint, app.view_functions[rule.endpoint], methods=rule.methods)
+    Swagger(docs)
+    return docs
+
+
+class LazyDocs:
+    # WSGI middleware answering /apidocs, /apispec_1.json and the Flasgger
+    # assets. The docs app is only built on the first such request, so
+    # workers that never serve docs never import Flasgger. With a prebuilt
+    # `spec_file` (see `flask build-apispec`) the spec is served from disk
+    # and only the UI needs the docs app.
+    def __init__(self, app, wsgi_app, spec_file=None):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.spec_file = spec_file
+        self._lock = threading.Lock()
+        self._docs = None
+
+    def _docs_app(self):
+        with self._lock:
+            if self._docs is None:
+                self._docs = build_docs_app(self.app)
+            return self._docs
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(DOCS_PREFIXES):
+            return self.wsgi_app(environ, start_response)
+        if self.spec_file and path == SPEC_ROUTE and os.path.isfile(self.spec_file):
+            with self.app.request_context(environ):
+                response = send_file(self.spec_file, mimetype='application/json', conditional=True)
+            return response(environ, start_response)
+        return self._docs_app()(environ, start_response)
+
+
+def init_app(app):
+    spec_file = app.config['API_DOCS_SPEC_FILE']
+    spec_file = os.path.abspath(spec_file) if spec_file else None
+    app.wsgi_app = LazyDocs(app, app.wsgi_app, spec_file)
+
+    @app.cli.command('build-apispec')
+    @click.argument('path', default=spec_file or 'apispec.json')
+    def build_apispec_command(path):
+        # Run at build time; point API_DOCS_SPEC_FILE at the output.
+        response = build_docs_app(app).test_client().get(SPEC_ROUTE)
+        with open(path, 'wb') as f:
+            f.write(response.get_data())
+        print("Wrote API spec to %s" % path)
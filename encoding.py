@@ -0,0 +1,95 @@
+import gzip
+import json
+import time
+
+from flask import request
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, only gzip is offered without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/csv', 'text/html')
+
+_flask_default = JSONEncoder().default
+
+
+class JSONCodec:
+    # Serializes response payloads to bytes with orjson when it is installed
+    # (backend='auto' or 'orjson') or with the stdlib json module
+    # (backend='stdlib'). Output matches jsonify's: compact, keys sorted when
+    # `sort_keys` is set, and Decimal/UUID/date values converted the way
+    # Flask's JSONEncoder does. `on_encode(seconds)` is an optional
+    # instrumentation hook.
+    def __init__(self, backend='auto', sort_keys=True, on_encode=None):
+        if backend == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_ENCODER=orjson but orjson is not installed')
+        if backend not in ('auto', 'orjson', 'stdlib'):
+            raise ValueError('Unknown JSON encoder %r' % backend)
+        self.backend = 'orjson' if backend != 'stdlib' and orjson is not None else 'stdlib'
+        self.sort_keys = sort_keys
+        self.on_encode = on_encode
+        if self.backend == 'orjson':
+            self._options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+                             | orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+
+    def dumps(self, data):
+        started = time.perf_counter()
+        if self.backend == 'orjson':
+            body = orjson.dumps(data, default=_flask_default, option=self._options)
+        else:
+            body = json.dumps(data, default=_flask_default, separators=(',', ':'),
+                              sort_keys=self.sort_keys).encode()
+        if self.on_encode is not None:
+            self.on_encode(time.perf_counter() - started)
+        return body
+
+
+def negotiate_encoding(accept_encoding):
+    # Picks 'br' or 'gzip' from a parsed Accept-Encoding header, or None.
+    if brotli is not None and accept_encoding.quality('br') > 0:
+        return 'br'
+    if accept_encoding.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, gzip_level=5, brotli_quality=4):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def init_app(app):
+    # Compresses buffered responses of at least COMPRESS_MIN_SIZE bytes with
+    # the best encoding the client accepts. ETags become weak, since the
+    # same validator now covers several byte representations.
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+    brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compress(data, encoding, gzip_level, brotli_quality))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,18 @@
+import os
+import shutil
+
+# Workers share metrics through files in PROMETHEUS_MULTIPROC_DIR. It must be
+# set before prometheus_client is first imported (by this file or the app).
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/servidor-2-metrics')
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,170 @@
+import base64
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+
+def encode_cursor(key):
+    raw = json.dumps([-key[0], key[1]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        score, initials = json.loads(raw)
+        return (-float(score), str(initials))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+class Leaderboard:
+    # In-process order-statistics view of the leaderboard table. Entries are
+    # kept in a sorted list of (-highest_score, initials) keys, so rank lookups
+    # are a binary search and top-N/keyset pages are slices. Each gunicorn
+    # worker holds its own copy; it is reloaded from MySQL every
+    # `refresh_interval` seconds, which bounds how long writes made by other
+    # workers take to show up. Writes made by this worker are applied in
+    # place through set_user()/update_score().
+    # etag() describes the copy being served rather than the shared counters:
+    # `version()` as read at load time, plus this process's local writes
+    # since, so the ETag only moves when the served ranking can have changed.
+    # The loader runs outside `_lock`, so reads of the current copy and score
+    # updates never wait for it; only one thread reloads at a time.
+    def __init__(self, loader, refresh_interval=30, version=None):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.version = version
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._keys = []
+        self._users = {}
+        self._loaded_at = None
+        self._version = None
+        self._local_writes = 0
+
+    def _is_fresh(self):
+        with self._lock:
+            return self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.refresh_interval
+
+    def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        # While one thread refreshes on a timer, others keep reading the
+        # previous copy; they only wait when there is none yet.
+        with self._lock:
+            blocking = self._loaded_at is None
+        if not self._reload_lock.acquire(blocking=blocking):
+            return
+        try:
+            # Another thread may have reloaded while this one waited.
+            if not self._is_fresh():
+                self.reload()
+        finally:
+            self._reload_lock.release()
+
+    def etag(self):
+        self._ensure_loaded()
+        with self._lock:
+            etag = str(self._version)
+            if self._local_writes:
+                # Other workers may have loaded the same version without
+                # these writes, so the suffix names the process.
+                etag += '-w%d.%d' % (os.getpid(), self._local_writes)
+            return etag
+
+    def reload(self, version=None):
+        # `version` must be read before the rows, so a write that lands in
+        # between triggers another reload rather than being missed.
+        if version is None and self.version is not None:
+            version = self.version()
+        rows = self.loader()
+        users = {}
+        for row in rows:
+            users[row['initials']] = {
+                'score': float(row['highest_score'] or 0),
+                'role': row['role'],
+                'group': row['group'],
+                'list': row['list'],
+            }
+        keys = sorted((-user['score'], initials) for initials, user in users.items())
+        with self._lock:
+            self._users = users
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+            self._version = version
+            self._local_writes = 0
+
+    def set_user(self, initials, score, role=None, group=None, list_name=None):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            user = self._users.get(initials)
+            if user is not None:
+                old_key = (-user['score'], initials)
+                del self._keys[bisect_left(self._keys, old_key)]
+            else:
+                user = self._users[initials] = {'role': role, 'group': group, 'list': list_name}
+            user['score'] = float(score)
+            insort(self._keys, (-user['score'], initials))
+            self._local_writes += 1
+
+    def update_score(self, initials, score):
+        # Only ever raises a user's score, matching leaderboard.highest_score.
+        with self._lock:
+            user = self._users.get(initials)
+            if user is not None and float(score) > user['score']:
+                self.set_user(initials, score)
+
+    def _matches(self, user, group, lists):
+        if group and user['group'] != group:
+            return False
+        if lists and user['list'] not in lists:
+            return False
+        return True
+
+    def _row(self, key):
+        user = self._users[key[1]]
+        return {'usuario_nombre': key[1], 'highest_score': user['score'], 'role': user['role']}
+
+    def page(self, limit=None, cursor=None, group='', lists=()):
+        # Returns (rows, next_cursor); next_cursor is None on the last page.
+        self._ensure_loaded()
+        with self._lock:
+            start = bisect_right(self._keys, decode_cursor(cursor)) if cursor else 0
+            rows = []
+            last_key = None
+            index = start
+            while index < len(self._keys) and (limit is None or len(rows) < limit):
+                key = self._keys[index]
+                if self._matches(self._users[key[1]], group, lists):
+                    rows.append(self._row(key))
+                    last_key = key
+                index += 1
+            has_more = limit is not None and len(rows) == limit and index < len(self._keys)
+            return rows, encode_cursor(last_key) if has_more else None
+
+    def rank(self, initials, group='', lists=()):
+        # 1-based rank; users with equal scores are ordered by initials.
+        self._ensure_loaded()
+        with self._lock:
+            user = self._users.get(initials)
+            if user is None or not self._matches(user, group, lists):
+                return None
+            key = (-user['score'], initials)
+            if not group and not lists:
+                position = bisect_left(self._keys, key)
+                total = len(self._keys)
+            else:
+                position = sum(1 for k in self._keys[:bisect_left(self._keys, key)]
+                               if self._matches(self._users[k[1]], group, lists))
+                total = sum(1 for u in self._users.values() if self._matches(u, group, lists))
+            return {
+                'usuario_nombre': initials,
+                'highest_score': user['score'],
+                'role': user['role'],
+                'rank': position + 1,
+                'total': total,
+            }
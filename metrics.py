@@ -0,0 +1,97 @@
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from flask.json import JSONEncoder
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+# Metrics are module level because prometheus_client registers them once per
+# process. Under gunicorn set PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py)
+# so every worker writes to shared files and /metrics reports the sum.
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route',
+    ['route', 'method', 'status'],
+)
+QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'SQL statement execution time',
+    ['statement'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+QUERY_ROWS = Counter(
+    'db_query_rows_total', 'Rows returned or changed by SQL statements',
+    ['statement'],
+)
+POOL_ACQUIRE = Histogram(
+    'db_pool_acquire_seconds', 'Time to check a connection out of the pool',
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30),
+)
+JSON_SERIALIZE = Histogram(
+    'json_serialize_seconds', 'Time spent encoding JSON responses',
+    ['route'],
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1),
+)
+REQUESTS_SHED = Counter(
+    'http_requests_shed_total', 'Requests rejected by admission control before reaching the database',
+    ['endpoint', 'reason'],
+)
+
+
+def current_route():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return 'none'
+
+
+def observe_query(statement, seconds, rows):
+    if seconds is not None:
+        QUERY_LATENCY.labels(statement).observe(seconds)
+    if rows:
+        QUERY_ROWS.labels(statement).inc(rows)
+
+
+def observe_acquire(seconds):
+    POOL_ACQUIRE.observe(seconds)
+
+
+def observe_json(seconds):
+    JSON_SERIALIZE.labels(current_route()).observe(seconds)
+
+
+def observe_shed(endpoint, reason):
+    REQUESTS_SHED.labels(endpoint or 'none', reason).inc()
+
+
+class TimedJSONEncoder(JSONEncoder):
+    def encode(self, o):
+        started = time.perf_counter()
+        try:
+            return super().encode(o)
+        finally:
+            JSON_SERIALIZE.labels(current_route()).observe(time.perf_counter() - started)
+
+
+def init_app(app):
+    app.json_encoder = TimedJSONEncoder
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            REQUEST_LATENCY.labels(current_route(), request.method, response.status_code).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
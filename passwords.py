@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def hash_method(pwhash):
+    # 'pbkdf2:sha256:260000$salt$hash' -> 'pbkdf2:sha256:260000'
+    return pwhash.split('$', 1)[0]
+
+
+def normalize_method(method):
+    # 'pbkdf2', 'pbkdf2:sha256' and 'pbkdf2:sha256:<werkzeug's default>' all
+    # produce the same hashes, so methods are compared by algorithm and cost
+    # rather than by their text.
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        hash_name = parts[1] if len(parts) > 1 and parts[1] else 'sha256'
+        iterations = int(parts[2]) if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        return ('pbkdf2', hash_name, iterations)
+    return tuple(parts)
+
+
+def _timed(fn, *args):
+    # Runs in the pool process. Wall-clock timestamps are comparable across
+    # processes, so the caller can tell executor queue time from hashing time.
+    started = time.time()
+    result = fn(*args)
+    return started, time.time(), result
+
+
+class PasswordHasher:
+    # Runs the deliberately slow key-derivation functions on a bounded process
+    # pool so a burst of logins cannot monopolize the request threads (or the
+    # GIL). At most `max_in_flight` hash operations are queued or running per
+    # worker; callers wait up to `queue_timeout` seconds for a slot and then
+    # get HasherBusy. Every operation takes its own slot, so a login never
+    # queues behind more than `max_in_flight` hashes, and bulk work
+    # (hash_many) may hold at most `bulk_in_flight` of them. With workers=0
+    # hashing runs inline.
+    def __init__(self, workers=2, max_in_flight=8, queue_timeout=5.0, method='pbkdf2:sha256:260000', salt_length=16,
+                 bulk_in_flight=None):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.bulk_in_flight = bulk_in_flight or max(max_in_flight // 2, 1)
+        self.queue_timeout = queue_timeout
+        self.method = method
+        self.salt_length = salt_length
+        self._normalized_method = normalize_method(method)
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_in_flight)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+        self._operations = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._hash_time_total = 0.0
+        self._hash_time_max = 0.0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _get_executor(self):
+        # Created lazily so each gunicorn worker owns its own pool.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _reject(self):
+        with self._lock:
+            self._rejected += 1
+        raise HasherBusy('Too many password operations in progress')
+
+    def _acquire(self, bulk):
+        if bulk and not self._bulk_slots.acquire(timeout=self.queue_timeout):
+            self._reject()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            if bulk:
+                self._bulk_slots.release()
+            self._reject()
+
+    def _release(self, bulk):
+        self._slots.release()
+        if bulk:
+            self._bulk_slots.release()
+
+    def _record(self, queued, started, finished):
+        # Wait time runs from the request for a slot to the start of hashing,
+        # so it includes time spent in the executor's queue.
+        with self._lock:
+            self._operations += 1
+            self._wait_time_total += started - queued
+            self._wait_time_max = max(self._wait_time_max, started - queued)
+            self._hash_time_total += finished - started
+            self._hash_time_max = max(self._hash_time_max, finished - started)
+
+    def _run(self, fn, *args):
+        return self._run_many(fn, [args])[0]
+
+    def _run_many(self, fn, arg_lists, bulk=False):
+        # Items are submitted one slot at a time and spread over all pool
+        # processes; each slot is released as soon as its item finishes.
+        futures = []
+        results = []
+        try:
+            for args in arg_lists:
+                queued = time.time()
+                self._acquire(bulk)
+                if not self.workers:
+                    try:
+                        started, finished, result = _timed(fn, *args)
+                    finally:
+                        self._release(bulk)
+                    self._record(queued, started, finished)
+                    results.append(result)
+                    continue
+                try:
+                    future = self._get_executor().submit(_timed, fn, *args)
+                except BaseException:
+                    self._release(bulk)
+                    raise
+                future.add_done_callback(lambda _, bulk=bulk: self._release(bulk))
+                futures.append((queued, future))
+        except BaseException:
+            # Items not started yet are cancelled, which releases their slots.
+            for _, future in futures:
+                future.cancel()
+            raise
+        for queued, future in futures:
+            started, finished, result = future.result()
+            self._record(queued, started, finished)
+            results.append(result)
+        return results
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def hash_many(self, passwords):
+        return self._run_many(generate_password_hash, [(p, self.method, self.salt_length) for p in passwords],
+                              bulk=True)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        try:
+            return normalize_method(hash_method(pwhash)) != self._normalized_method
+        except ValueError:
+            return True
+
+    def record_rehash(self):
+        with self._lock:
+            self._rehashed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_in_flight': self.max_in_flight,
+                'bulk_in_flight': self.bulk_in_flight,
+                'method': self.method,
+                'operations': self._operations,
+                'rejected': self._rejected,
+                'rehashed': self._rehashed,
+                'hash_time_total': round(self._hash_time_total, 6),
+                'hash_time_max': round(self._hash_time_max, 6),
+                'hash_time_avg': round(self._hash_time_total / self._operations, 6) if self._operations else 0.0,
+                'wait_time_total': round(self._wait_time_total, 6),
+                'wait_time_max': round(self._wait_time_max, 6),
+                'wait_time_avg': round(self._wait_time_total / self._operations, 6) if self._operations else 0.0,
+            }
@@ -0,0 +1,126 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import time
+
+from flask import abort, jsonify, request, send_from_directory
+from werkzeug.exceptions import HTTPException
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def route_slug(rule):
+    return _UNSAFE.sub('_', rule.strip('/')) or 'root'
+
+
+class ProfilingMiddleware:
+    # WSGI middleware that runs a request under cProfile when it carries the
+    # configured X-Profile-Token header or is picked by the sample rate. The
+    # whole WSGI call is profiled, including Flask, Flasgger and body
+    # iteration, and written as <dir>/<route>/<timestamp>.pstats.
+    # Unsampled requests only pay for one header lookup and a random().
+    def __init__(self, app, wsgi_app, directory, token=None, sample_rate=0.0, max_files=50):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+
+    def _sampled(self, environ):
+        header = environ.get('HTTP_X_PROFILE_TOKEN')
+        if header and self.token and hmac.compare_digest(header, self.token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _route(self, environ):
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.rule
+        except HTTPException:
+            return 'unmatched'
+
+    def __call__(self, environ, start_response):
+        if not self._sampled(environ):
+            return self.wsgi_app(environ, start_response)
+
+        profiler = cProfile.Profile()
+        started = time.time()
+        profiler.enable()
+        try:
+            app_iter = self.wsgi_app(environ, start_response)
+            try:
+                body = list(app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+        finally:
+            profiler.disable()
+            self._save(profiler, self._route(environ), started)
+        return body
+
+    def _save(self, profiler, route, started):
+        try:
+            folder = os.path.join(self.directory, route_slug(route))
+            os.makedirs(folder, exist_ok=True)
+            name = '%s-%03d-%d.pstats' % (time.strftime('%Y%m%dT%H%M%S', time.gmtime(started)),
+                                          int(started * 1000) % 1000, os.getpid())
+            profiler.dump_stats(os.path.join(folder, name))
+            files = sorted(os.listdir(folder))
+            for old in files[:-self.max_files]:
+                os.remove(os.path.join(folder, old))
+        except OSError as e:
+            print("Could not write profile:", str(e))
+
+
+def list_profiles(directory):
+    profiles = []
+    if not os.path.isdir(directory):
+        return profiles
+    for route in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, route)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder), reverse=True):
+            stat = os.stat(os.path.join(folder, name))
+            profiles.append({'route': route, 'file': '%s/%s' % (route, name), 'size': stat.st_size,
+                             'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(stat.st_mtime))})
+    return profiles
+
+
+def init_app(app):
+    directory = os.path.abspath(app.config['PROFILE_DIR'])
+    token = app.config['PROFILE_TOKEN']
+    app.wsgi_app = ProfilingMiddleware(
+        app, app.wsgi_app, directory,
+        token=token,
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        max_files=app.config['PROFILE_MAX_FILES'],
+    )
+
+    def require_token():
+        header = request.headers.get('X-Profile-Token', '')
+        if not token or not hmac.compare_digest(header, token):
+            abort(404)
+
+    @app.route('/admin/profiles', methods=['GET'])
+    def get_profiles():
+        require_token()
+        return jsonify(list_profiles(directory)), 200
+
+    @app.route('/admin/profiles/<path:name>', methods=['GET'])
+    def get_profile(name):
+        require_token()
+        if request.args.get('format') == 'text':
+            path = os.path.join(directory, name)
+            if not os.path.abspath(path).startswith(directory + os.sep) or not os.path.isfile(path):
+                abort(404)
+            out = io.StringIO()
+            stats = pstats.Stats(path, stream=out)
+            stats.sort_stats('cumulative').print_stats(request.args.get('limit', 50, type=int))
+            return out.getvalue(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+        return send_from_directory(directory, name, as_attachment=True)
@@ -0,0 +1,102 @@
+import math
+
+BULK_CHUNK_SIZE = 500
+
+# user_levels.score and user_levels.tries are signed INT columns.
+MAX_SCORE = 2147483647
+MAX_TRIES = 2147483647
+
+_TRUE = ('true', '1', 'yes')
+_FALSE = ('false', '0', 'no', '')
+
+
+def parse_bool(value):
+    # Strict: the strings "false" and "0" are False, anything unrecognized
+    # is an error rather than truthy.
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _TRUE + _FALSE:
+        return value.strip().lower() in _TRUE
+    raise ValueError('completed must be a boolean')
+
+
+def normalize_level_update(item, user_initials=None):
+    # Validates one level result as sent by the game client and returns it in
+    # the canonical form used by the bulk writer. Raises ValueError.
+    if not isinstance(item, dict):
+        raise ValueError('Each update must be an object')
+    user_initials = user_initials or item.get('user_initials') or item.get('user')
+    if not user_initials or not isinstance(user_initials, str):
+        raise ValueError('Missing data for user_initials')
+    try:
+        level_id = int(item['level_id'])
+        score = float(item.get('score', 0) or 0)
+        tries = int(item.get('tries', 0) or 0)
+    except KeyError:
+        raise ValueError('Missing data for level_id')
+    except (TypeError, ValueError):
+        raise ValueError('level_id, score and tries must be numbers')
+    if not math.isfinite(score) or not 0 <= score <= MAX_SCORE:
+        raise ValueError('score must be between 0 and %d' % MAX_SCORE)
+    if not 0 <= tries <= MAX_TRIES:
+        raise ValueError('tries must be between 0 and %d' % MAX_TRIES)
+    return {
+        'user_initials': user_initials,
+        'level_id': level_id,
+        'score': score,
+        'tries': tries,
+        'completed': parse_bool(item.get('completed', False)),
+    }
+
+
+def collapse_level_updates(updates):
+    # Keeps only the last update for each (user_initials, level_id); returns
+    # the surviving updates keyed by that pair, in first-seen order.
+    latest = {}
+    for update in updates:
+        key = (update['user_initials'], update['level_id'])
+        latest.pop(key, None)
+        latest[key] = update
+    return latest
+
+
+def existing_keys(cursor, keys):
+    # Returns the subset of (user_initials, level_id) pairs that already have
+    # a user_levels row (registration creates one per level). Like the single
+    # PUT, the batch and write-behind paths only update existing rows.
+    # FOR UPDATE keeps the rows from disappearing before the upsert.
+    keys = sorted(set(keys))
+    found = set()
+    for start in range(0, len(keys), BULK_CHUNK_SIZE):
+        chunk = keys[start:start + BULK_CHUNK_SIZE]
+        cursor.execute(
+            "SELECT user_initials, level_id FROM user_levels WHERE (user_initials, level_id) IN (%s) FOR UPDATE"
+            % ','.join(['(%s, %s)'] * len(chunk)),
+            tuple(value for key in chunk for value in key)
+        )
+        found.update((row[0], row[1]) for row in cursor.fetchall())
+    return found
+
+
+def apply_level_updates(cursor, updates):
+    # Writes the given (already collapsed, existing) updates with multi-row
+    # INSERT ... ON DUPLICATE KEY UPDATE statements. The caller commits.
+    updates = list(updates)
+    for start in range(0, len(updates), BULK_CHUNK_SIZE):
+        chunk = updates[start:start + BULK_CHUNK_SIZE]
+        params = []
+        for update in chunk:
+            params.extend((update['user_initials'], update['level_id'],
+                           update['score'], update['tries'], update['completed']))
+        cursor.execute("""
+            INSERT INTO user_levels (user_initials, level_id, score, tries, completed)
+            VALUES %s
+            ON DUPLICATE KEY UPDATE
+                score = VALUES(score),
+                tries = VALUES(tries),
+                completed = VALUES(completed)
+        """ % ','.join(['(%s, %s, %s, %s, %s)'] * len(chunk)), tuple(params))
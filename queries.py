@@ -0,0 +1,107 @@
+# SQL shared by the WSGI app (app.py) and the ASGI app (asgi.py), so both
+# serve the same results. Builders return (query, params) with %s
+# placeholders, which mysql-connector and aiomysql both accept.
+
+POINTS_COLUMN = "t.total_score AS total_puntuacion"
+# Assuming each try is 60 seconds
+TIME_COLUMN = "t.total_tries * 60 AS total_tiempo"
+
+
+def user_filters(group='', lists=()):
+    conditions = []
+    params = []
+    if group:
+        conditions.append("u.group = %s")
+        params.append(group)
+    if lists:
+        conditions.append("u.list IN (%s)" % ','.join(['%s'] * len(lists)))
+        params.extend(lists)
+    return conditions, params
+
+
+def user_totals_query(columns, group='', lists=()):
+    # Per-user dashboard rows from the user_object_totals aggregate; users
+    # without any objects are left out, as with the original objects join.
+    conditions, params = user_filters(group, lists)
+    query = """
+        SELECT
+            u.initials AS usuario_nombre,
+            u.group AS grupo_nombre,
+            u.list AS list,
+            u.role AS role,
+            %s
+        FROM users u
+        JOIN user_object_totals t ON u.initials = t.user_initials
+        WHERE %s
+    """ % (',\n            '.join(columns), " AND ".join(["t.object_count > 0"] + conditions))
+    return query, tuple(params)
+
+
+GROUPS_QUERY = "SELECT DISTINCT `group` AS group_name FROM users"
+
+# Loads the whole in-process leaderboard (leaderboard.py).
+LEADERBOARD_QUERY = """
+    SELECT u.initials, u.role, u.group, u.list, l.highest_score
+    FROM users u
+    JOIN leaderboard l ON u.initials = l.student_id
+"""
+
+
+def lists_query(group=''):
+    if group:
+        return "SELECT DISTINCT `list` FROM users WHERE `group` = %s", (group,)
+    return "SELECT DISTINCT `list` FROM users", ()
+
+
+# Both dashboard facets come from one read of the (group, list) index.
+FACETS_QUERY = "SELECT DISTINCT `group`, `list` FROM users"
+
+
+def dashboard_facets(rows, group=''):
+    # FACETS_QUERY rows -> the /data/groups and /data/lists payloads.
+    groups = list(dict.fromkeys(row['group'] for row in rows))
+    lists = list(dict.fromkeys(row['list'] for row in rows if not group or row['group'] == group))
+    return [{'group_name': name} for name in groups], [{'list': name} for name in lists]
+
+
+def group_comparison_where(groups, lists=()):
+    conditions = ["u.group IN (%s)" % ','.join(['%s'] * len(groups))]
+    params = list(groups)
+    if lists:
+        conditions.append("u.list IN (%s)" % ','.join(['%s'] * len(lists)))
+        params.extend(lists)
+    return " AND ".join(conditions), tuple(params)
+
+
+def group_scores_query(where):
+    return """
+        SELECT
+            u.group AS `group`,
+            o.score
+        FROM users u
+        JOIN objects o ON u.initials = o.user_initials
+        WHERE """ + where
+
+
+def group_scores(rows):
+    # group_scores_query rows -> [{'group': ..., 'scores': [...]}] in first-seen order.
+    group_data = {}
+    for row in rows:
+        group_data.setdefault(row['group'], []).append(row['score'])
+    return [{'group': group, 'scores': scores} for group, scores in group_data.items()]
+
+
+# Statements below run on nearly every request; the sync app keeps them
+# prepared per connection (ConnectionPool.prepared_cursor), so their text
+# must stay constant.
+LOGIN_QUERY = "SELECT initials, password, role, list, `group`, gender FROM users WHERE initials = %s"
+
+USER_EXISTS = "SELECT 1 FROM users WHERE initials = %s"
+
+REHASH_PASSWORD = "UPDATE users SET password = %s WHERE initials = %s AND password = %s"
+
+UPDATE_USER_LEVEL = """
+    UPDATE user_levels
+    SET score = %s, tries = %s, completed = %s
+    WHERE user_initials = %s AND level_id = %s
+"""
@@ -0,0 +1,167 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+
+from db import PoolTimeout
+
+READ_YOUR_WRITES_COOKIE = 'primary_until'
+# Cross-site clients (the dashboard on another origin) never send the
+# SameSite=Lax cookie, so the same deadline is also returned in this header
+# for them to echo on their next requests.
+READ_YOUR_WRITES_HEADER = 'X-Primary-Until'
+
+
+class ReadRouter:
+    # Sends read-only queries to a replica pool and everything else to the
+    # primary. Reads fall back to the primary while the replica is failing or
+    # lagging by more than `max_lag` seconds (checked at most every
+    # `check_interval` seconds), and for clients that wrote within the
+    # read-your-writes window (tracked with a cookie or header, see
+    # mark_write()). With lag_check=False the replica's replication status is
+    # not read (managed readers may not expose it) and it is only checked for
+    # reachability.
+    # Exposes the same connection()/cursor() API as ConnectionPool.
+    def __init__(self, primary, replica=None, max_lag=5.0, check_interval=5.0, read_your_writes=5.0,
+                 lag_check=True):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.lag_check = lag_check
+        self.check_interval = check_interval
+        self.read_your_writes = read_your_writes
+        # Bumped whenever reads switch between replica and primary so that
+        # memoized data versions are re-read from the new source.
+        self.generation = 0
+
+        self._lock = threading.Lock()
+        self._healthy = replica is not None
+        self._checked_at = 0.0
+        self._lag = None
+        self._fallbacks = 0
+        self._replica_reads = 0
+        self._primary_reads = 0
+
+    def _set_healthy(self, healthy):
+        with self._lock:
+            if healthy != self._healthy:
+                self._healthy = healthy
+                self.generation += 1
+            self._checked_at = time.monotonic()
+
+    def _replica_lag(self):
+        with self.replica.cursor(dictionary=True) as (conn, cursor):
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except Exception:
+                # MySQL before 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+            status = cursor.fetchone()
+        if not status:
+            return None
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        return None if lag is None else float(lag)
+
+    def _ping_replica(self):
+        with self.replica.cursor() as (conn, cursor):
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+
+    def _replica_usable(self):
+        if self.replica is None:
+            return False
+        with self._lock:
+            due = time.monotonic() - self._checked_at >= self.check_interval
+            if due:
+                # Only one thread per interval runs the check.
+                self._checked_at = time.monotonic()
+        if due:
+            try:
+                if self.lag_check:
+                    self._lag = self._replica_lag()
+                    healthy = self._lag is not None and self._lag <= self.max_lag
+                else:
+                    self._ping_replica()
+                    healthy = True
+            except Exception as e:
+                print("Replica health check failed:", str(e))
+                healthy = False
+            self._set_healthy(healthy)
+        return self._healthy
+
+    def pinned_to_primary(self):
+        # True for requests from a client that wrote within the read-your-writes window.
+        if self.replica is None or not self.read_your_writes or not has_request_context():
+            return False
+        until = request.headers.get(READ_YOUR_WRITES_HEADER) or request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)
+        try:
+            until = float(until)
+        except ValueError:
+            return False
+        # A forged deadline pins a client for at most one window.
+        now = time.time()
+        return now < until <= now + self.read_your_writes + 1
+
+    def mark_write(self, response):
+        # Pins this client's reads to the primary for the read-your-writes window.
+        if self.replica is not None and self.read_your_writes:
+            until = '%.3f' % (time.time() + self.read_your_writes)
+            response.set_cookie(READ_YOUR_WRITES_COOKIE, until,
+                                max_age=int(self.read_your_writes) + 1, httponly=True, samesite='Lax')
+            response.headers[READ_YOUR_WRITES_HEADER] = until
+        return response
+
+    @contextmanager
+    def connection(self):
+        if self._replica_usable() and not self.pinned_to_primary():
+            try:
+                conn = self.replica.acquire()
+            except PoolTimeout:
+                # Replica pool exhausted: use the primary for this read only.
+                conn = None
+            except Exception as e:
+                print("Replica unavailable, reading from primary:", str(e))
+                self._set_healthy(False)
+                conn = None
+            if conn is None:
+                with self._lock:
+                    self._fallbacks += 1
+            else:
+                with self._lock:
+                    self._replica_reads += 1
+                try:
+                    yield conn
+                finally:
+                    self.replica.release(conn)
+                return
+        with self._lock:
+            self._primary_reads += 1
+        with self.primary.connection() as conn:
+            yield conn
+
+    def invalidate(self, conn):
+        # Marks a connection from connection() to be closed instead of
+        # returned; it does not matter which pool it came from.
+        self.primary.invalidate(conn)
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        with self.connection() as conn:
+            cursor = conn.cursor(**kwargs)
+            try:
+                yield conn, cursor
+            finally:
+                cursor.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'replica_configured': self.replica is not None,
+                'replica_healthy': self._healthy,
+                'lag_check': self.lag_check,
+                'replica_lag': self._lag,
+                'replica_reads': self._replica_reads,
+                'primary_reads': self._primary_reads,
+                'fallbacks': self._fallbacks,
+            }
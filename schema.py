@@ -0,0 +1,277 @@
+from contextlib import closing
+
+
+def add_index(table, name, columns):
+    # DDL commits implicitly, so a migration that fails halfway cannot be
+    # rolled back; steps built with this helper skip indexes that already
+    # exist and the migration can simply be re-run.
+    def step(cursor):
+        cursor.execute("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            LIMIT 1
+        """, (table, name))
+        if not cursor.fetchall():
+            cursor.execute("ALTER TABLE %s ADD INDEX %s (%s)" % (table, name, columns))
+    return step
+
+
+def create_trigger(statement):
+    # With binary logging on and log_bin_trust_function_creators=0 (the RDS
+    # default) MySQL refuses CREATE TRIGGER to users without SUPER.
+    def step(cursor):
+        try:
+            cursor.execute(statement)
+        except Exception as e:
+            if getattr(e, 'errno', None) == 1419:
+                raise RuntimeError('Creating triggers needs log_bin_trust_function_creators=1 (set it in the '
+                                   'DB parameter group) or the SUPER privilege: %s' % e)
+            raise
+    return step
+
+# Versioned schema migrations. Each entry is applied exactly once per
+# database and recorded in `schema_migrations`; to change the schema append a
+# new entry, never edit one that has already shipped. A step is either a SQL
+# statement or a callable taking the cursor.
+MIGRATIONS = [
+    (1, 'Initial tables and default levels', [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            initials VARCHAR(255) PRIMARY KEY,
+            password VARCHAR(255) NOT NULL,
+            role VARCHAR(50) NOT NULL,
+            list VARCHAR(50),
+            `group` VARCHAR(50),
+            gender VARCHAR(50)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS statistics (
+            initials VARCHAR(255),
+            games_played INT DEFAULT 0,
+            average_score FLOAT DEFAULT 0,
+            highest_score FLOAT DEFAULT 0,
+            PRIMARY KEY (initials),
+            FOREIGN KEY (initials) REFERENCES users(initials)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            student_id VARCHAR(255),
+            highest_score FLOAT DEFAULT 0,
+            PRIMARY KEY (student_id),
+            FOREIGN KEY (student_id) REFERENCES users(initials)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS objects (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            score FLOAT NOT NULL,
+            tries INT NOT NULL,
+            user_initials VARCHAR(255),
+            FOREIGN KEY (user_initials) REFERENCES users(initials)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS levels (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            max_score INT NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_levels (
+            user_initials VARCHAR(255),
+            level_id INT,
+            completed BOOLEAN DEFAULT FALSE,
+            score INT DEFAULT 0,
+            tries INT DEFAULT 0,
+            PRIMARY KEY (user_initials, level_id),
+            FOREIGN KEY (user_initials) REFERENCES users(initials),
+            FOREIGN KEY (level_id) REFERENCES levels(id)
+        );
+        """,
+        # Seed the default levels only when the table is empty
+        """
+        INSERT INTO levels (name, max_score)
+        SELECT seed.name, seed.max_score FROM (
+            SELECT 'Level 1' AS name, 100 AS max_score
+            UNION ALL SELECT 'Level 2', 200
+            UNION ALL SELECT 'Level 3', 300
+        ) AS seed
+        WHERE NOT EXISTS (SELECT 1 FROM levels LIMIT 1);
+        """,
+    ]),
+    (2, 'Per-user totals over objects', [
+        """
+        CREATE TABLE IF NOT EXISTS user_object_totals (
+            user_initials VARCHAR(255) PRIMARY KEY,
+            total_score DOUBLE NOT NULL DEFAULT 0,
+            total_tries BIGINT NOT NULL DEFAULT 0,
+            object_count INT NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_initials) REFERENCES users(initials)
+        );
+        """,
+        """
+        INSERT INTO user_object_totals (user_initials, total_score, total_tries, object_count)
+        SELECT user_initials, SUM(score), SUM(tries), COUNT(*)
+        FROM objects
+        WHERE user_initials IS NOT NULL
+        GROUP BY user_initials
+        ON DUPLICATE KEY UPDATE
+            total_score = VALUES(total_score),
+            total_tries = VALUES(total_tries),
+            object_count = VALUES(object_count);
+        """,
+    ]),
+    (3, 'Data version counters for ETags', [
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name VARCHAR(50) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        );
+        """,
+        """
+        INSERT IGNORE INTO data_versions (name, version)
+        VALUES ('users', 0), ('scores', 0), ('objects', 0);
+        """,
+    ]),
+    # Covering indexes for the dashboard filters (InnoDB secondary indexes
+    # carry the primary key, so initials comes for free) and for the
+    # per-user scans over objects.
+    (4, 'Secondary indexes for analytics queries', [
+        add_index('users', 'idx_users_group_list', '`group`, `list`, role'),
+        add_index('users', 'idx_users_list_group', '`list`, `group`, role'),
+        add_index('objects', 'idx_objects_user_score', 'user_initials, score, tries'),
+    ]),
+    # `objects` is written by other tools, not by this app, so the per-user
+    # totals and the 'objects' data version are kept in step by triggers in
+    # the writer's own transaction. The totals are then re-synced for rows
+    # written since migration 2. DEPLOY_ONLY: with binary logging on (e.g. on
+    # RDS) creating triggers needs log_bin_trust_function_creators=1.
+    (5, 'Maintain object totals and version with triggers', [
+        "DROP TRIGGER IF EXISTS objects_after_insert;",
+        "DROP TRIGGER IF EXISTS objects_after_update;",
+        "DROP TRIGGER IF EXISTS objects_after_delete;",
+        create_trigger("""
+        CREATE TRIGGER objects_after_insert AFTER INSERT ON objects FOR EACH ROW
+        BEGIN
+            IF NEW.user_initials IS NOT NULL THEN
+                INSERT INTO user_object_totals (user_initials, total_score, total_tries, object_count)
+                VALUES (NEW.user_initials, NEW.score, NEW.tries, 1)
+                ON DUPLICATE KEY UPDATE
+                    total_score = total_score + VALUES(total_score),
+                    total_tries = total_tries + VALUES(total_tries),
+                    object_count = object_count + 1;
+            END IF;
+            UPDATE data_versions SET version = version + 1 WHERE name = 'objects';
+        END
+        """),
+        create_trigger("""
+        CREATE TRIGGER objects_after_update AFTER UPDATE ON objects FOR EACH ROW
+        BEGIN
+            IF OLD.user_initials IS NOT NULL THEN
+                UPDATE user_object_totals
+                SET total_score = total_score - OLD.score,
+                    total_tries = total_tries - OLD.tries,
+                    object_count = object_count - 1
+                WHERE user_initials = OLD.user_initials;
+                DELETE FROM user_object_totals WHERE user_initials = OLD.user_initials AND object_count <= 0;
+            END IF;
+            IF NEW.user_initials IS NOT NULL THEN
+                INSERT INTO user_object_totals (user_initials, total_score, total_tries, object_count)
+                VALUES (NEW.user_initials, NEW.score, NEW.tries, 1)
+                ON DUPLICATE KEY UPDATE
+                    total_score = total_score + VALUES(total_score),
+                    total_tries = total_tries + VALUES(total_tries),
+                    object_count = object_count + 1;
+            END IF;
+            UPDATE data_versions SET version = version + 1 WHERE name = 'objects';
+        END
+        """),
+        create_trigger("""
+        CREATE TRIGGER objects_after_delete AFTER DELETE ON objects FOR EACH ROW
+        BEGIN
+            IF OLD.user_initials IS NOT NULL THEN
+                UPDATE user_object_totals
+                SET total_score = total_score - OLD.score,
+                    total_tries = total_tries - OLD.tries,
+                    object_count = object_count - 1
+                WHERE user_initials = OLD.user_initials;
+                DELETE FROM user_object_totals WHERE user_initials = OLD.user_initials AND object_count <= 0;
+            END IF;
+            UPDATE data_versions SET version = version + 1 WHERE name = 'objects';
+        END
+        """),
+        """
+        INSERT INTO user_object_totals (user_initials, total_score, total_tries, object_count)
+        SELECT user_initials, SUM(score), SUM(tries), COUNT(*)
+        FROM objects
+        WHERE user_initials IS NOT NULL
+        GROUP BY user_initials
+        ON DUPLICATE KEY UPDATE
+            total_score = VALUES(total_score),
+            total_tries = VALUES(total_tries),
+            object_count = VALUES(object_count);
+        """,
+        """
+        DELETE FROM user_object_totals
+        WHERE user_initials NOT IN (SELECT user_initials FROM objects WHERE user_initials IS NOT NULL);
+        """,
+        "UPDATE data_versions SET version = version + 1 WHERE name = 'objects';",
+    ]),
+]
+
+SCHEMA_LOCK = 'gamedb_schema_migrations'
+
+# Migrations that need privileges or settings worker start-up cannot assume;
+# they (and everything after them) are only applied by `flask migrate-db`.
+DEPLOY_ONLY = {5}
+
+
+def current_version(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn, log=print, deploy=False):
+    # Several gunicorn workers may start at the same time, so migrations run
+    # under a MySQL named lock and re-read the version once it is held.
+    # Unless `deploy` is set, stops before the first DEPLOY_ONLY migration.
+    with closing(conn.cursor()) as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, 60)", (SCHEMA_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError('Could not acquire the schema migration lock')
+        try:
+            version = current_version(cursor)
+            applied = []
+            for number, description, statements in MIGRATIONS:
+                if number <= version:
+                    continue
+                if number in DEPLOY_ONLY and not deploy:
+                    log("Schema migration %d (%s) is pending; apply it with `flask migrate-db`"
+                        % (number, description))
+                    break
+                log("Applying schema migration %d: %s" % (number, description))
+                for statement in statements:
+                    if callable(statement):
+                        statement(cursor)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (number, description)
+                )
+                conn.commit()
+                applied.append(number)
+            return applied
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK,))
+            cursor.fetchone()
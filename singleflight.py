@@ -0,0 +1,85 @@
+import threading
+from functools import wraps
+
+from flask import make_response
+
+from cache import request_key, shareable_headers
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Coalesces identical concurrent GET requests within a worker: the first
+    # request for a key (route plus normalized query string) runs the view,
+    # requests arriving while it is in flight wait for it and replay its
+    # serialized response. Nothing is kept once the leader finishes, so no
+    # staleness is added beyond the query's own duration. Followers give up
+    # waiting after `timeout` seconds and run the view themselves, as they do
+    # when the leader's response was streamed. Requests for which `bypass()`
+    # is true always run on their own.
+    def __init__(self, enabled=True, timeout=30, bypass=None):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.bypass = bypass
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        self._leaders = 0
+        self._shared = 0
+        self._timeouts = 0
+
+    def coalesced(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or (self.bypass is not None and self.bypass()):
+                return view(*args, **kwargs)
+            key = request_key()
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self._leaders += 1
+
+            if not leader:
+                if not call.done.wait(self.timeout):
+                    with self._lock:
+                        self._timeouts += 1
+                    return view(*args, **kwargs)
+                if call.error is not None:
+                    raise call.error
+                if call.result is None:
+                    return view(*args, **kwargs)
+                with self._lock:
+                    self._shared += 1
+                body, status, headers = call.result
+                return make_response(body, status, headers)
+
+            try:
+                response = make_response(view(*args, **kwargs))
+                if not response.is_streamed:
+                    call.result = (response.get_data(), response.status_code, shareable_headers(response))
+                return response
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'in_flight': len(self._calls),
+                'leaders': self._leaders,
+                'shared': self._shared,
+                'timeouts': self._timeouts,
+            }
@@ -0,0 +1,46 @@
+import json
+
+
+def stream_group_scores(pool, query, params, chunk_size=1000):
+    # Yields the group comparison payload ([{"group": ..., "scores": [...]}])
+    # as JSON text while reading rows in chunks from an unbuffered cursor, so
+    # memory stays flat regardless of the size of `objects`. `query` must
+    # return (group, score) rows ordered by group. The connection is held
+    # until the generator is exhausted or closed by the server. When it is
+    # closed early (the client disconnected) the rest of the result is still
+    # unread, so the connection is invalidated rather than drained.
+    with pool.connection() as conn:
+        cursor = conn.cursor(buffered=False)
+        finished = False
+        try:
+            cursor.execute(query, params)
+            yield '['
+            current = None
+            first_score = True
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                parts = []
+                for group, score in rows:
+                    if group != current:
+                        if current is not None:
+                            parts.append(']},')
+                        parts.append('{"group": %s, "scores": [' % json.dumps(group))
+                        current = group
+                        first_score = True
+                    if not first_score:
+                        parts.append(',')
+                    parts.append(json.dumps(score))
+                    first_score = False
+                yield ''.join(parts)
+            if current is not None:
+                yield ']}'
+            yield ']'
+            finished = True
+        finally:
+            if finished:
+                cursor.close()
+            else:
+                # cursor.close() would raise "Unread result found".
+                pool.invalidate(conn)
@@ -0,0 +1,67 @@
+QUANTILES = (('p25', 25), ('p50', 50), ('p75', 75), ('p90', 90))
+
+
+def nearest_rank(percent, count):
+    # ceil(percent / 100 * count) in integer arithmetic, matching MySQL's CEIL.
+    return max(-(-percent * count // 100), 1)
+
+
+def group_score_summary(cursor, where, params, bins=10):
+    # Per-group descriptive statistics of objects.score computed in MySQL, so
+    # only a few rows per group cross the wire. `where` filters the
+    # users u JOIN objects o rows. Quantiles use the nearest-rank method and
+    # histograms share one set of fixed-width bins across all groups so they
+    # can be compared directly.
+    base = """
+        FROM users u
+        JOIN objects o ON u.initials = o.user_initials
+        WHERE %s
+    """ % where
+
+    cursor.execute("""
+        SELECT u.group, COUNT(*), AVG(o.score), STDDEV_POP(o.score), MIN(o.score), MAX(o.score)
+    """ + base + " GROUP BY u.group ORDER BY u.group", params)
+    summary = {}
+    for group, count, mean, stddev, low, high in cursor.fetchall():
+        summary[group] = {
+            'group': group,
+            'count': count,
+            'mean': float(mean),
+            'stddev': float(stddev),
+            'min': float(low),
+            'max': float(high),
+        }
+    if not summary:
+        return []
+
+    positions = ','.join('GREATEST(CEIL(%d * n / 100), 1)' % percent for _, percent in QUANTILES)
+    cursor.execute("""
+        SELECT grp, n, pos, score FROM (
+            SELECT u.group AS grp, o.score AS score,
+                   ROW_NUMBER() OVER (PARTITION BY u.group ORDER BY o.score) AS pos,
+                   COUNT(*) OVER (PARTITION BY u.group) AS n
+    """ + base + """
+        ) ranked
+        WHERE pos IN (""" + positions + ")", params)
+    by_position = {}
+    for group, n, pos, score in cursor.fetchall():
+        by_position[(group, pos)] = float(score)
+    for group, stats in summary.items():
+        for name, percent in QUANTILES:
+            stats[name] = by_position.get((group, nearest_rank(percent, stats['count'])))
+
+    low = min(stats['min'] for stats in summary.values())
+    high = max(stats['max'] for stats in summary.values())
+    width = (high - low) / bins if high > low else 1.0
+    cursor.execute("""
+        SELECT u.group, LEAST(FLOOR((o.score - %s) / %s), %s) AS bin, COUNT(*)
+    """ + base + " GROUP BY u.group, bin", (low, width, bins - 1) + tuple(params))
+    for stats in summary.values():
+        stats['histogram'] = {
+            'edges': [low + width * i for i in range(bins + 1)],
+            'counts': [0] * bins,
+        }
+    for group, bin_index, count in cursor.fetchall():
+        summary[group]['histogram']['counts'][int(bin_index)] = count
+
+    return list(summary.values())
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip('flask')
+
+from admission import AdmissionControl, Overloaded, RateLimited, parse_rate, parse_rate_limits  # noqa: E402
+
+
+def test_parse_rate():
+    assert parse_rate('5') == (5.0, 5.0)
+    assert parse_rate('0.5') == (0.5, 1.0)
+    assert parse_rate('2:10') == (2.0, 10.0)
+    assert parse_rate_limits('login=1:5, register=0.1') == {'login': (1.0, 5.0), 'register': (0.1, 1.0)}
+
+
+def test_bucket_allows_burst_then_rejects():
+    shed = []
+    admission = AdmissionControl({'login': (1.0, 2.0)}, on_shed=lambda endpoint, reason: shed.append(reason))
+    admission.check_rate('1.2.3.4', 'login')
+    admission.check_rate('1.2.3.4', 'login')
+    with pytest.raises(RateLimited) as excinfo:
+        admission.check_rate('1.2.3.4', 'login')
+    assert excinfo.value.retry_after >= 1
+    # Buckets are per client and per endpoint.
+    admission.check_rate('5.6.7.8', 'login')
+    admission.check_rate('1.2.3.4', 'points')
+    assert shed == ['rate_limited']
+    assert admission.stats()['rate_limited'] == {'login': 1}
+
+
+def test_unlimited_endpoints_and_client_eviction():
+    admission = AdmissionControl({'login': (1.0, 1.0)}, max_clients=2)
+    for _ in range(100):
+        admission.check_rate('1.2.3.4', 'points')
+    for client in ('a', 'b', 'c'):
+        admission.check_rate(client, 'login')
+    assert admission.stats()['clients'] == 2
+    # 'a' was evicted, so its bucket starts full again.
+    admission.check_rate('a', 'login')
+
+
+def test_concurrency_slots():
+    admission = AdmissionControl(max_concurrency=1, queue_timeout=0.01)
+    admission.enter('dashboard')
+    with pytest.raises(Overloaded):
+        admission.enter('dashboard')
+    admission.leave()
+    admission.enter('dashboard')
+    admission.leave()
+    stats = admission.stats()
+    assert stats['in_flight'] == 0
+    assert stats['admitted'] == 2
+    assert stats['overloaded'] == {'dashboard': 1}
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+pytest.importorskip('flask')
+
+from cache import ResponseCache  # noqa: E402
+
+
+def store(cache, key, tags=('scores',), generation=None, token=None):
+    cache.set(key, tags, b'body', 200, [], generation, token)
+
+
+def test_hit_and_miss():
+    cache = ResponseCache()
+    assert cache.get('k') is None
+    store(cache, 'k')
+    assert cache.get('k')['body'] == b'body'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_invalidate_drops_entries_by_tag():
+    cache = ResponseCache()
+    store(cache, 'scores', tags=('users', 'scores'))
+    store(cache, 'objects', tags=('objects',))
+    cache.invalidate('scores')
+    assert cache.get('scores') is None
+    assert cache.get('objects') is not None
+
+
+def test_result_computed_across_an_invalidation_is_not_stored():
+    cache = ResponseCache()
+    generation = cache.generation
+    cache.invalidate('scores')
+    store(cache, 'k', generation=generation)
+    assert cache.get('k') is None
+    store(cache, 'k', generation=cache.generation)
+    assert cache.get('k') is not None
+
+
+def test_entries_from_another_version_are_ignored():
+    cache = ResponseCache()
+    store(cache, 'k', token='s1')
+    assert cache.get('k', 's2') is None
+    assert cache.get('k', 's1') is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_ttl_and_lru_eviction():
+    cache = ResponseCache(max_entries=2, ttl=0.01)
+    store(cache, 'a')
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+    cache = ResponseCache(max_entries=2)
+    store(cache, 'a')
+    store(cache, 'b')
+    cache.get('a')
+    store(cache, 'c')
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+pytest.importorskip('mysql.connector')
+
+from db import ConnectionPool, PoolTimeout, statement_label  # noqa: E402
+
+
+class FakeConnection:
+    def __init__(self):
+        self.in_transaction = False
+        self.rolled_back = False
+        self.closed = False
+        self.healthy = True
+        self._pool_created_at = time.monotonic()
+        self._pool_statements = {}
+
+    def ping(self, reconnect=False):
+        if not self.healthy or self.closed:
+            raise RuntimeError('gone away')
+
+    def rollback(self):
+        self.rolled_back = True
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    pool = ConnectionPool({}, **kwargs)
+    pool.opened = []
+
+    def connect():
+        conn = FakeConnection()
+        pool.opened.append(conn)
+        return conn
+    pool._connect = connect
+    return pool
+
+
+def test_idle_connection_is_reused():
+    pool = make_pool(size=1, max_overflow=0)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert pool.stats()['checkouts'] == 2
+    assert pool.stats()['idle'] == 1
+
+
+def test_overflow_connections_are_closed_on_release():
+    pool = make_pool(size=1, max_overflow=1)
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    stats = pool.stats()
+    assert stats['open'] == 1
+    assert stats['idle'] == 1
+    assert second.closed
+
+
+def test_exhausted_pool_times_out():
+    pool = make_pool(size=1, max_overflow=0, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_open_transaction_is_rolled_back_on_release():
+    pool = make_pool(size=1, max_overflow=0)
+    with pool.connection() as conn:
+        conn.in_transaction = True
+    assert conn.rolled_back
+    assert pool.stats()['idle'] == 1
+
+
+def test_unhealthy_idle_connection_is_replaced():
+    pool = make_pool(size=1, max_overflow=0)
+    with pool.connection() as conn:
+        pass
+    conn.healthy = False
+    with pool.connection() as replacement:
+        pass
+    assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()['discarded'] == 1
+
+
+def test_invalidated_connection_is_discarded():
+    pool = make_pool(size=1, max_overflow=0)
+    with pool.connection() as conn:
+        conn.in_transaction = True
+        pool.invalidate(conn)
+    assert conn.closed
+    assert not conn.rolled_back
+    stats = pool.stats()
+    assert stats['idle'] == 0
+    assert stats['open'] == 0
+    assert stats['discarded'] == 1
+
+
+def test_statement_label_folds_placeholder_lists():
+    assert statement_label("SELECT *\n  FROM t WHERE (a, b) IN ((%s, %s), (%s, %s))") == \
+        "SELECT * FROM t WHERE (a, b) IN ((?))"
@@ -0,0 +1,98 @@
+import pytest
+
+from leaderboard import Leaderboard, decode_cursor, encode_cursor
+
+ROWS = [
+    {'initials': 'aa', 'role': 'student', 'group': 'A', 'list': 'l1', 'highest_score': 50},
+    {'initials': 'bb', 'role': 'student', 'group': 'B', 'list': 'l1', 'highest_score': 90},
+    {'initials': 'cc', 'role': 'teacher', 'group': 'A', 'list': 'l2', 'highest_score': 90},
+    {'initials': 'dd', 'role': 'student', 'group': 'B', 'list': 'l2', 'highest_score': None},
+]
+
+
+class Loader:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return list(self.rows)
+
+
+def names(rows):
+    return [row['usuario_nombre'] for row in rows]
+
+
+def test_page_orders_by_score_then_initials():
+    board = Leaderboard(Loader(ROWS))
+    rows, next_cursor = board.page()
+    assert names(rows) == ['bb', 'cc', 'aa', 'dd']
+    assert rows[-1]['highest_score'] == 0.0
+    assert next_cursor is None
+
+
+def test_keyset_pages_cover_every_user_once():
+    board = Leaderboard(Loader(ROWS))
+    first, cursor = board.page(limit=2)
+    second, last_cursor = board.page(limit=2, cursor=cursor)
+    assert names(first) == ['bb', 'cc']
+    assert names(second) == ['aa', 'dd']
+    assert last_cursor is None
+
+
+def test_filters_and_rank():
+    board = Leaderboard(Loader(ROWS))
+    rows, _ = board.page(group='A')
+    assert names(rows) == ['cc', 'aa']
+    assert board.rank('aa')['rank'] == 3
+    assert board.rank('aa', group='A') == {
+        'usuario_nombre': 'aa', 'highest_score': 50.0, 'role': 'student', 'rank': 2, 'total': 2,
+    }
+    assert board.rank('bb', group='A') is None
+    assert board.rank('zz') is None
+
+
+def test_update_score_only_raises_scores():
+    board = Leaderboard(Loader(ROWS))
+    board.page()
+    board.update_score('aa', 10)
+    assert board.rank('aa')['highest_score'] == 50.0
+    board.update_score('aa', 100)
+    assert board.rank('aa')['rank'] == 1
+
+
+def test_etag_moves_with_local_writes_only():
+    versions = iter(['u1-s1', 'u1-s2', 'u1-s3'])
+    loader = Loader(ROWS)
+    board = Leaderboard(loader, refresh_interval=60, version=lambda: next(versions))
+    etag = board.etag()
+    assert etag == 'u1-s1'
+    # Shared counters moving do not reload the table within the interval.
+    board.page()
+    assert loader.calls == 1
+    assert board.etag() == etag
+    board.update_score('aa', 10)
+    assert board.etag() == etag
+    board.update_score('aa', 100)
+    assert board.etag() != etag
+    assert board.etag().startswith('u1-s1-w')
+
+
+def test_reload_after_refresh_interval_resets_local_writes():
+    loader = Loader(ROWS)
+    board = Leaderboard(loader, refresh_interval=0, version=lambda: 'v%d' % loader.calls)
+    board.set_user('ee', 5, 'student', 'A', 'l1')
+    assert loader.calls == 0
+    board.page()
+    board.set_user('ee', 5, 'student', 'A', 'l1')
+    board.page()
+    assert loader.calls == 2
+    assert board.etag() == 'v2'
+    assert board.rank('ee') is None
+
+
+def test_cursor_round_trip_and_garbage():
+    assert decode_cursor(encode_cursor((-90.0, 'bb'))) == (-90.0, 'bb')
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
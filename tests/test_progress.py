@@ -0,0 +1,58 @@
+import pytest
+
+from progress import MAX_SCORE, MAX_TRIES, collapse_level_updates, normalize_level_update, parse_bool
+
+
+@pytest.mark.parametrize('value, expected', [
+    (True, True), (False, False), (None, False), (1, True), (0, False),
+    ('true', True), (' Yes ', True), ('1', True), ('false', False), ('0', False), ('no', False), ('', False),
+])
+def test_parse_bool(value, expected):
+    assert parse_bool(value) is expected
+
+
+@pytest.mark.parametrize('value', ['maybe', 2, -1, 1.0, [], {}])
+def test_parse_bool_rejects_anything_else(value):
+    with pytest.raises(ValueError):
+        parse_bool(value)
+
+
+def test_normalize_level_update():
+    update = normalize_level_update({'level_id': '3', 'score': '12.5', 'tries': 2, 'completed': 'false'}, 'ab')
+    assert update == {'user_initials': 'ab', 'level_id': 3, 'score': 12.5, 'tries': 2, 'completed': False}
+
+
+def test_normalize_level_update_defaults_and_user_fields():
+    assert normalize_level_update({'user': 'ab', 'level_id': 1}) == {
+        'user_initials': 'ab', 'level_id': 1, 'score': 0.0, 'tries': 0, 'completed': False,
+    }
+    assert normalize_level_update({'user_initials': 'cd', 'level_id': 1})['user_initials'] == 'cd'
+
+
+@pytest.mark.parametrize('item, message', [
+    ('not an object', 'object'),
+    ({'level_id': 1}, 'user_initials'),
+    ({'user_initials': 'ab'}, 'level_id'),
+    ({'user_initials': 'ab', 'level_id': 'x'}, 'numbers'),
+    ({'user_initials': 'ab', 'level_id': 1, 'score': -1}, 'score'),
+    ({'user_initials': 'ab', 'level_id': 1, 'score': MAX_SCORE + 1}, 'score'),
+    ({'user_initials': 'ab', 'level_id': 1, 'score': 'nan'}, 'score'),
+    ({'user_initials': 'ab', 'level_id': 1, 'score': 'inf'}, 'score'),
+    ({'user_initials': 'ab', 'level_id': 1, 'tries': -1}, 'tries'),
+    ({'user_initials': 'ab', 'level_id': 1, 'tries': MAX_TRIES + 1}, 'tries'),
+    ({'user_initials': 'ab', 'level_id': 1, 'completed': 'sometimes'}, 'completed'),
+])
+def test_normalize_level_update_rejects(item, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_level_update(item)
+
+
+def test_collapse_keeps_last_update_per_key():
+    updates = [
+        {'user_initials': 'ab', 'level_id': 1, 'score': 1},
+        {'user_initials': 'cd', 'level_id': 1, 'score': 2},
+        {'user_initials': 'ab', 'level_id': 1, 'score': 3},
+    ]
+    collapsed = collapse_level_updates(updates)
+    assert list(collapsed) == [('cd', 1), ('ab', 1)]
+    assert collapsed[('ab', 1)]['score'] == 3
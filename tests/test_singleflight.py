@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from singleflight import SingleFlight  # noqa: E402
+
+
+def test_concurrent_identical_requests_share_one_call():
+    app = flask.Flask(__name__)
+    single_flight = SingleFlight(timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    @single_flight.coalesced
+    def view():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'payload'
+
+    bodies = []
+
+    def request():
+        with app.test_request_context('/data/points?b=2&a=1'):
+            bodies.append(view().get_data())
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=request)
+    follower.start()
+    # Give the follower time to start waiting on the leader.
+    time.sleep(0.1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert bodies == [b'payload', b'payload']
+    stats = single_flight.stats()
+    assert stats['leaders'] + stats['shared'] == 2
+    assert len(calls) == stats['leaders']
+    assert stats['in_flight'] == 0
+
+
+def test_leader_error_is_raised_to_followers_and_not_kept():
+    app = flask.Flask(__name__)
+    single_flight = SingleFlight()
+
+    @single_flight.coalesced
+    def view():
+        raise RuntimeError('boom')
+
+    with app.test_request_context('/x'):
+        with pytest.raises(RuntimeError):
+            view()
+    assert single_flight.stats()['in_flight'] == 0
+
+
+def test_bypass_runs_view_directly():
+    app = flask.Flask(__name__)
+    single_flight = SingleFlight(bypass=lambda: True)
+
+    @single_flight.coalesced
+    def view():
+        return 'direct'
+
+    with app.test_request_context('/x'):
+        assert view() == 'direct'
+    assert single_flight.stats()['leaders'] == 0
@@ -0,0 +1,88 @@
+import json
+from contextlib import contextmanager
+
+from streaming import stream_group_scores
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.closed = False
+
+    def execute(self, query, params):
+        self.query = query
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        if self.rows:
+            raise RuntimeError('Unread result found')
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.cursors = []
+        self.rows = rows
+
+    def cursor(self, buffered=True):
+        cursor = FakeCursor(self.rows)
+        self.cursors.append(cursor)
+        return cursor
+
+
+class FakePool:
+    def __init__(self, rows):
+        self.conn = FakeConnection(rows)
+        self.invalidated = []
+        self.released = 0
+
+    @contextmanager
+    def connection(self):
+        try:
+            yield self.conn
+        finally:
+            self.released += 1
+
+    def invalidate(self, conn):
+        self.invalidated.append(conn)
+
+
+ROWS = [('A', 1), ('A', 2.5), ('B', 3), ('C', 4), ('C', 5), ('C', 6)]
+
+
+def test_stream_is_valid_json():
+    for chunk_size in (1, 2, 4, 100):
+        pool = FakePool(ROWS)
+        payload = json.loads(''.join(stream_group_scores(pool, 'SELECT', (), chunk_size)))
+        assert payload == [
+            {'group': 'A', 'scores': [1, 2.5]},
+            {'group': 'B', 'scores': [3]},
+            {'group': 'C', 'scores': [4, 5, 6]},
+        ]
+        assert pool.conn.cursors[0].closed
+        assert pool.invalidated == []
+
+
+def test_empty_stream_is_valid_json():
+    pool = FakePool([])
+    assert json.loads(''.join(stream_group_scores(pool, 'SELECT', ()))) == []
+
+
+def test_group_names_are_escaped():
+    pool = FakePool([('say "hi"\n', 1)])
+    payload = json.loads(''.join(stream_group_scores(pool, 'SELECT', ())))
+    assert payload == [{'group': 'say "hi"\n', 'scores': [1]}]
+
+
+def test_early_close_invalidates_connection():
+    pool = FakePool(ROWS)
+    chunks = stream_group_scores(pool, 'SELECT', (), chunk_size=2)
+    assert next(chunks) == '['
+    next(chunks)
+    chunks.close()
+    assert pool.invalidated == [pool.conn]
+    assert not pool.conn.cursors[0].closed
+    assert pool.released == 1
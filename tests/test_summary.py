@@ -0,0 +1,18 @@
+import math
+
+import pytest
+
+from summary import nearest_rank
+
+
+@pytest.mark.parametrize('percent, count, expected', [
+    (25, 4, 1), (50, 4, 2), (75, 4, 3), (90, 10, 9), (90, 11, 10), (50, 1, 1), (25, 3, 1), (0, 5, 1), (100, 7, 7),
+])
+def test_nearest_rank(percent, count, expected):
+    assert nearest_rank(percent, count) == expected
+
+
+def test_nearest_rank_matches_ceil():
+    for count in range(1, 200):
+        for percent in (25, 50, 75, 90):
+            assert nearest_rank(percent, count) == max(math.ceil(percent * count / 100), 1)
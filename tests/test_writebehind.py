@@ -0,0 +1,151 @@
+import threading
+
+import pytest
+
+from writebehind import WriteBehindBuffer, BufferFull
+
+
+def update(initials, level_id, score=10):
+    return {'user_initials': initials, 'level_id': level_id, 'score': score, 'tries': 1, 'completed': False}
+
+
+def make_buffer(flush_fn, **kwargs):
+    # A long interval keeps the background thread idle; tests flush by hand.
+    kwargs.setdefault('flush_interval', 60)
+    kwargs.setdefault('flush_size', 1000)
+    return WriteBehindBuffer(flush_fn, **kwargs)
+
+
+def test_updates_are_collapsed_per_key():
+    batches = []
+    buffer = make_buffer(batches.append)
+    buffer.submit(update('ab', 1, 10))
+    buffer.submit(update('ab', 1, 20))
+    buffer.submit(update('cd', 1, 30))
+    buffer.flush()
+    buffer.close()
+    assert len(batches) == 1
+    assert sorted((u['user_initials'], u['score']) for u in batches[0]) == [('ab', 20), ('cd', 30)]
+    stats = buffer.stats()
+    assert stats['collapsed'] == 1
+    assert stats['flushed'] == 2
+
+
+def test_failing_batch_is_bisected_and_bad_row_dead_lettered():
+    written = []
+
+    def flush(batch):
+        if any(u['level_id'] == 3 for u in batch):
+            raise ValueError('bad row')
+        written.extend(batch)
+
+    buffer = make_buffer(flush, max_retries=1)
+    for level_id in range(1, 5):
+        buffer.submit(update('ab', level_id))
+    buffer.flush()
+    buffer.close()
+    assert sorted(u['level_id'] for u in written) == [1, 2, 4]
+    stats = buffer.stats()
+    assert stats['flushed'] == 3
+    assert stats['dropped'] == 1
+    assert stats['depth'] == 0
+    assert stats['dead_letters'][0]['level_id'] == 3
+    assert stats['dead_letters'][0]['error'] == 'bad row'
+
+
+def test_failed_rows_are_retried_until_max_retries():
+    calls = []
+
+    def flush(batch):
+        calls.append(len(batch))
+        raise ValueError('bad row')
+
+    buffer = make_buffer(flush, max_retries=3)
+    buffer.submit(update('ab', 1))
+    buffer.flush()
+    assert buffer.stats()['requeued'] == 1
+    assert buffer.stats()['backoff'] > 0
+    buffer.flush()
+    buffer.flush()
+    stats = buffer.stats()
+    buffer.close()
+    assert calls == [1, 1, 1]
+    assert stats['requeued'] == 2
+    assert stats['dropped'] == 1
+    assert stats['depth'] == 0
+
+
+def test_transient_errors_retry_the_whole_batch():
+    calls = []
+
+    def flush(batch):
+        calls.append(len(batch))
+        raise ConnectionError('database unreachable')
+
+    buffer = make_buffer(flush, is_transient=lambda e: isinstance(e, ConnectionError))
+    for level_id in range(1, 5):
+        buffer.submit(update('ab', level_id))
+    buffer.flush()
+    stats = buffer.stats()
+    buffer.flush_fn = lambda batch: None
+    buffer.close()
+    assert calls == [4]
+    assert stats['depth'] == 4
+    assert stats['requeued'] == 4
+    assert stats['failures'] == 1
+
+
+def test_requeue_respects_max_pending():
+    buffer = None
+
+    def flush(batch):
+        # New updates fill the buffer while the failing batch is in flight.
+        buffer.submit(update('new', 1))
+        buffer.submit(update('new', 2))
+        raise ConnectionError('database unreachable')
+
+    buffer = make_buffer(flush, max_pending=2, is_transient=lambda e: True)
+    buffer.submit(update('old', 1))
+    buffer.submit(update('old', 2))
+    buffer.flush()
+    stats = buffer.stats()
+    buffer.flush_fn = lambda batch: None
+    buffer.close()
+    assert stats['depth'] == 2
+    assert stats['dropped'] == 2
+    assert stats['requeued'] == 0
+
+
+def test_newer_update_replaces_failed_one():
+    buffer = None
+
+    def flush(batch):
+        if batch[0]['score'] == 10:
+            buffer.submit(update('ab', 1, 99))
+            raise ValueError('bad row')
+
+    buffer = make_buffer(flush)
+    buffer.submit(update('ab', 1, 10))
+    buffer.flush()
+    assert buffer.stats()['requeued'] == 0
+    buffer.flush()
+    stats = buffer.stats()
+    buffer.close()
+    assert stats['flushed'] == 1
+    assert stats['dropped'] == 0
+
+
+def test_submit_after_close_is_rejected():
+    buffer = make_buffer(lambda batch: None)
+    buffer.close()
+    with pytest.raises(BufferFull):
+        buffer.submit(update('ab', 1))
+
+
+def test_background_thread_flushes_full_buffer():
+    flushed = threading.Event()
+    buffer = WriteBehindBuffer(lambda batch: flushed.set(), flush_size=2, flush_interval=60)
+    buffer.submit(update('ab', 1))
+    buffer.submit(update('ab', 2))
+    assert flushed.wait(5)
+    buffer.close()
@@ -0,0 +1,94 @@
+import threading
+import time
+from contextlib import closing
+from functools import wraps
+
+from flask import request, make_response
+
+# 'users' and 'scores' are bumped by this app after its writes; 'objects' by
+# the triggers on `objects` (schema migration 5) in the writer's transaction.
+DATA_VERSION_NAMES = ('users', 'scores', 'objects')
+
+
+def bump_statement(names):
+    return "UPDATE data_versions SET version = version + 1 WHERE name IN (%s)" % ','.join(['%s'] * len(names)), names
+
+
+def format_etag(versions, tags):
+    return '-'.join('%s%d' % (tag[0], versions.get(tag, 0)) for tag in tags)
+
+
+def bump_data_version(conn, *names):
+    # Called right after a write has been committed. Bumping in a separate
+    # short transaction keeps the counter row from serializing every write;
+    # readers may briefly see new data under the old version, which only
+    # costs them one extra full response.
+    with closing(conn.cursor()) as cursor:
+        cursor.execute(*bump_statement(names))
+    conn.commit()
+
+
+class DataVersions:
+    # Shared (per-database) change counters used to build ETags for the
+    # /data/* endpoints. Reads are memoized for `max_age` seconds so that a
+    # burst of polls costs at most one primary-key lookup per worker.
+    # `pool` may be a ReadRouter: the counters are then read from the same
+    # server as the data and re-read whenever its generation changes.
+    # Requests for which `bypass()` is true skip the If-None-Match check.
+    def __init__(self, pool, max_age=1.0, bypass=None):
+        self.pool = pool
+        self.max_age = max_age
+        self.bypass = bypass
+        self._lock = threading.Lock()
+        self._versions = None
+        self._read_at = 0.0
+        self._generation = None
+
+    def current(self):
+        generation = getattr(self.pool, 'generation', None)
+        with self._lock:
+            if (self._versions is not None and self._generation == generation
+                    and time.monotonic() - self._read_at < self.max_age):
+                return self._versions
+        with self.pool.cursor() as (conn, cursor):
+            cursor.execute("SELECT name, version FROM data_versions")
+            versions = dict(cursor.fetchall())
+        with self._lock:
+            self._versions = versions
+            self._read_at = time.monotonic()
+            self._generation = generation
+        return versions
+
+    def bump(self, conn, *names):
+        bump_data_version(conn, *names)
+        self.invalidate()
+
+    def invalidate(self):
+        # Forces the next read; for counters bumped outside bump().
+        with self._lock:
+            self._versions = None
+
+    def etag(self, tags):
+        return format_etag(self.current(), tags)
+
+    def conditional(self, *tags, etag=None):
+        # Answers If-None-Match with 304 before the view runs any SQL.
+        # `etag()`, when given, replaces the ETag built from `tags`, for views
+        # that serve an in-process copy loaded at an older version.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.bypass is not None and self.bypass():
+                    return view(*args, **kwargs)
+                current = self.etag(tags) if etag is None else etag()
+                # Weak comparison: compressed responses carry W/ ETags.
+                if request.if_none_match.contains_weak(current):
+                    response = make_response('', 304)
+                    response.set_etag(current)
+                    return response
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    response.set_etag(current)
+                return response
+            return wrapper
+        return decorator
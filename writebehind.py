@@ -0,0 +1,206 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+
+class BufferFull(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    # Bounded in-process buffer for level progress updates. Updates are
+    # collapsed per (user_initials, level_id) and handed to `flush_fn` in
+    # batches by a background thread once `flush_size` keys are pending or
+    # `flush_interval` seconds have passed. When `max_pending` keys are
+    # waiting, submit() blocks for up to `put_timeout` seconds and then raises
+    # BufferFull so the caller can shed load.
+    #
+    # A failed flush is bisected to isolate the updates that fail on their
+    # own, unless `is_transient(error)` says the error would fail any batch
+    # alike (the database is unreachable), in which case it is retried whole. Failed updates
+    # are re-queued, within `max_pending`, until they have failed
+    # `max_retries` times and are then dropped to a dead-letter list. After a
+    # failure the next flush waits with exponential backoff, up to
+    # `max_backoff` seconds.
+    def __init__(self, flush_fn, max_pending=5000, flush_size=200, flush_interval=1.0, put_timeout=2.0,
+                 max_retries=5, max_backoff=30.0, is_transient=None):
+        self.flush_fn = flush_fn
+        self.max_pending = max_pending
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.is_transient = is_transient
+
+        self._lock = threading.Condition()
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._attempts = {}
+        self._retry_at = 0.0
+        self._consecutive_failures = 0
+        self._dead_letters = deque(maxlen=20)
+
+        self._submitted = 0
+        self._collapsed = 0
+        self._rejected = 0
+        self._flushed = 0
+        self._flushes = 0
+        self._failures = 0
+        self._requeued = 0
+        self._dropped = 0
+        self._max_depth = 0
+        self._flush_time_total = 0.0
+        self._flush_time_max = 0.0
+        self._flush_time_last = 0.0
+
+        atexit.register(self.close)
+
+    def _ensure_worker(self):
+        # The worker thread is started lazily so that it lives in the gunicorn
+        # worker process that accepts the updates, not in the master.
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def submit(self, update):
+        key = (update['user_initials'], update['level_id'])
+        deadline = time.monotonic() + self.put_timeout
+        with self._lock:
+            if self._closed:
+                raise BufferFull('Write-behind buffer is shut down')
+            self._ensure_worker()
+            while key not in self._pending and len(self._pending) >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._rejected += 1
+                    raise BufferFull('Write-behind buffer is full')
+                self._lock.notify_all()
+                self._lock.wait(remaining)
+            if key in self._pending:
+                self._collapsed += 1
+            # A newer update for the key starts with a clean retry count.
+            self._attempts.pop(key, None)
+            self._pending[key] = update
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, len(self._pending))
+            if len(self._pending) >= self.flush_size:
+                self._lock.notify_all()
+
+    def _take_batch(self):
+        batch = list(self._pending.values())
+        self._pending = {}
+        self._lock.notify_all()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._lock:
+                # A full buffer flushes early, but never before the backoff
+                # after a failure has passed.
+                deadline = max(time.monotonic() + self.flush_interval, self._retry_at)
+                while not self._closed:
+                    now = time.monotonic()
+                    full = len(self._pending) >= self.flush_size
+                    if now >= deadline or (full and now >= self._retry_at):
+                        break
+                    self._lock.wait((self._retry_at if full else deadline) - now)
+                if self._closed:
+                    return
+                batch = self._take_batch()
+            if batch:
+                self._flush_batch(batch)
+
+    def _write(self, batch):
+        # Returns (updates that could not be written, last error).
+        try:
+            self.flush_fn(batch)
+            return [], None
+        except Exception as e:
+            if len(batch) == 1 or (self.is_transient is not None and self.is_transient(e)):
+                return batch, e
+        middle = len(batch) // 2
+        failed_left, error_left = self._write(batch[:middle])
+        failed_right, error_right = self._write(batch[middle:])
+        return failed_left + failed_right, error_right or error_left
+
+    def _flush_batch(self, batch):
+        started = time.monotonic()
+        failed, error = self._write(batch)
+        elapsed = time.monotonic() - started
+        failed_ids = {id(update) for update in failed}
+        with self._lock:
+            for update in batch:
+                if id(update) not in failed_ids:
+                    self._attempts.pop((update['user_initials'], update['level_id']), None)
+            self._flushes += 1
+            self._flushed += len(batch) - len(failed)
+            self._flush_time_total += elapsed
+            self._flush_time_max = max(self._flush_time_max, elapsed)
+            self._flush_time_last = elapsed
+            if not failed:
+                self._consecutive_failures = 0
+                self._retry_at = 0.0
+                return
+            self._failures += 1
+            self._consecutive_failures += 1
+            backoff = min(self.flush_interval * 2 ** (self._consecutive_failures - 1), self.max_backoff)
+            self._retry_at = time.monotonic() + backoff
+            for update in failed:
+                key = (update['user_initials'], update['level_id'])
+                if key in self._pending:
+                    # A newer update for the key arrived; it replaces this one.
+                    continue
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_retries or len(self._pending) >= self.max_pending:
+                    self._attempts.pop(key, None)
+                    self._dropped += 1
+                    self._dead_letters.append(dict(update, error=str(error)))
+                    continue
+                self._attempts[key] = attempts
+                self._pending[key] = update
+                self._requeued += 1
+        print("Error flushing write-behind buffer (%d of %d updates failed, retrying in %.1fs):"
+              % (len(failed), len(batch), backoff), str(error))
+
+    def flush(self):
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._flush_batch(batch)
+
+    def close(self):
+        # Flush-on-shutdown hook; also registered with atexit.
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._lock.notify_all()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'depth': len(self._pending),
+                'max_depth': self._max_depth,
+                'max_pending': self.max_pending,
+                'submitted': self._submitted,
+                'collapsed': self._collapsed,
+                'rejected': self._rejected,
+                'flushed': self._flushed,
+                'flushes': self._flushes,
+                'failures': self._failures,
+                'requeued': self._requeued,
+                'dropped': self._dropped,
+                'dead_letters': list(self._dead_letters),
+                'backoff': round(max(self._retry_at - time.monotonic(), 0.0), 3),
+                'flush_time_total': round(self._flush_time_total, 6),
+                'flush_time_max': round(self._flush_time_max, 6),
+                'flush_time_last': round(self._flush_time_last, 6),
+                'flush_time_avg': round(self._flush_time_total / self._flushes, 6) if self._flushes else 0.0,
+            }